@@ -1,16 +1,11 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
-from modules.stats import Summary
+from modules.cube import get_summary_slice
 from modules.text import show_glossary, translate, date_format
-from modules.design import business_colormap
-from modules.tools import aggrid_interactive_table, convert_df
-from modules.db import load_data
+from modules.design import trend_figure
+from modules.tools import aggrid_interactive_table
 from modules.auth import check_password, signout
-import plotly.graph_objects as go
-
-pio.templates.default = "simple_white"
+from modules import profiling
 
 def update_business():
         st.session_state.view_index = 0
@@ -29,21 +24,24 @@ def click_business(all_business, selected_name):
         del st.session_state.wba9
 
 def main():
-    daily_summary, media = load_data(['daily_summary', 'latest_media'])
+    # The db layer (SQLAlchemy) is only imported once the password check has passed
+    from modules.db import refresh_data, table_version
+    from modules.media import load_media_index
+
+    daily_version = table_version('daily_summary')
+    daily_summary = refresh_data('daily_summary')
     # daily_summary = pd.read_csv('data/df_daily_summary.csv')
     # media = pd.read_csv('data/updated_media.csv')
     
-    df_daily_summary = daily_summary.copy()
-    df_daily_summary['date'] = pd.to_datetime(df_daily_summary['date'])
-    summarizer = Summary(df_daily_summary.sort_values('date'))
-    n_business = df_daily_summary['name'].nunique()
-    all_business = df_daily_summary['name'].unique()
+    # refresh_data returns the compact dtypes of modules.schema (categorical name, parsed date), so no copy is needed
+    n_business = daily_summary['name'].nunique()
+    all_business = daily_summary['name'].unique().tolist()
     # business_colormap = dict(zip(all_business, ['#f7b32b', '#08605f', '#8e4162', '#b3cdd1', '#c7f0bd', '#bbe5ed', '#9f4a54', '#fff07c', '#ff7f11', '#ff1b1c', '#edc9ff', '#f2b79f', '#0c6291', '#231123']))
-    all_date = pd.to_datetime(df_daily_summary['date'].unique())
+    all_date = pd.DatetimeIndex(daily_summary['date'].unique())
     up_to_date = all_date.max()
     tab1, tab2, tab3 = st.tabs(['현황', '기간 내 추이', '용어 사전'])
     
-    period_range = range(1,  df_daily_summary["date"].nunique())
+    period_range = range(1,  daily_summary["date"].nunique())
     with st.sidebar:
         
         selected_name = st.selectbox('보고 싶은 계정', all_business, index=3, on_change = update_business)
@@ -54,7 +52,7 @@ def main():
 
         
 
-    df_daily_summary = summarizer.get_summaries(summary_func=['diff', 'pct_change'], periods = [period])
+    df_daily_summary = get_summary_slice(daily_summary, period, version = daily_version)
     df_latest = df_daily_summary.loc[df_daily_summary['date'] == up_to_date].reset_index(drop = True)    
     df_latest.columns = translate(df_latest.columns)
     up_to_date = date_format(up_to_date)
@@ -102,7 +100,7 @@ def main():
 
         with st.expander(label = '테이블 보기'):
             st.write(f'{up_to_date} 기준')
-            aggrid_interactive_table(df=df_latest_toshow)
+            aggrid_interactive_table(df=df_latest_toshow, key = 'latest')
             # csv = convert_df(df_latest_toshow)
             # st.download_button(
             # label="csv로 저장하기",
@@ -112,9 +110,7 @@ def main():
             # )    
     
         with st.expander(label = '게시물 보기'):
-            df_media = media.copy()
-            for c in ['timestamp', 'date']:
-                df_media[c] = pd.to_datetime(df_media[c])
+            media_index = load_media_index()
            
             st.subheader(f'[{selected_name}] 게시물')
             media_option = st.radio(label = '옵션', options = ['전체(최신순)', '좋아요 많은 순', '댓글 많은 순'], horizontal= True, label_visibility= 'collapsed')
@@ -123,8 +119,8 @@ def main():
             col1, col2, col3, col4, col5 = st.columns([0.1, 0.1, 0.5, 0.1, 0.1])
             with col1:
                 n_view = st.selectbox("보기 수", options = range(2, 7), index = 1)
-                selected_media = df_media.loc[df_media['name'] == selected_name].sort_values({'전체(최신순)': 'date', '좋아요 많은 순': 'like_count', '댓글 많은 순': 'comments_count'}[media_option], ascending= False).reset_index(drop = True).T.to_dict()
-                n_selected_media = len(selected_media.keys())
+                sort_key = {'전체(최신순)': 'date', '좋아요 많은 순': 'like_count', '댓글 많은 순': 'comments_count'}[media_option]
+                n_selected_media = media_index.count(selected_name)
                 st.caption(f'{n_selected_media}개')
                 max_page = n_selected_media - n_view - 1
                 
@@ -147,29 +143,30 @@ def main():
             with col3:
                 view_index = st.slider('슬라이드로 넘기기', min_value= 0, max_value = max_page, key = 'view_index')
 
+            selected_media = media_index.page(selected_name, sort_key, offset = view_index, limit = n_view).to_dict('records')
             cols = st.columns(n_view)
-            for c in range(n_view):
+            for c in range(len(selected_media)):
                 
                 with cols[c]:
                     with st.container():
-                        media_time = date_format(selected_media[view_index + c]['timestamp'])
+                        media_time = date_format(selected_media[c]['timestamp'])
                         st.caption(media_time)
-                        media_url = selected_media[view_index + c]['media_url']
+                        media_url = selected_media[c]['media_url']
                         if pd.isnull(media_url):
                             media_url = 'https://upload.wikimedia.org/wikipedia/commons/thumb/a/ac/No_image_available.svg/1024px-No_image_available.svg.png'
-                        if selected_media[view_index + c]['media_type'] == 'VIDEO':
+                        if selected_media[c]['media_type'] == 'VIDEO':
                             st.video(media_url)
                         else:
                             st.image(media_url)
                         st.markdown(f'''
-                        ❤️ {selected_media[view_index + c]['like_count']}
-                        💬 {selected_media[view_index + c]['comments_count']}
+                        ❤️ {selected_media[c]['like_count']}
+                        💬 {selected_media[c]['comments_count']}
                         ''')
-                        st.caption(selected_media[view_index + c]['caption'])
+                        st.caption(selected_media[c]['caption'])
                         
                     st.markdown(f'''
                     
-                    [🔗 게시물로]({selected_media[view_index + c]['permalink']})
+                    [🔗 게시물로]({selected_media[c]['permalink']})
                     
                     ''')
         
@@ -178,14 +175,12 @@ def main():
         st.subheader(f'📈[{selected_name}] 기간 내 추이')
         
         
-        source = df_daily_summary.copy()
-        source.columns = translate(source)
+        # df_daily_summary is this session's view of the shared slice, so its headers can be translated in place
+        source = df_daily_summary
+        source.columns = translate(source.columns)
         col1, col2, col3, col4 = st.columns(4)
    
         all_features =  source.select_dtypes('number').drop(columns = 'id').columns
-        
-        source = summarizer.get_summaries(summary_func = ['diff', 'pct_change'], periods = [period], fillna = False)
-        source.columns = translate(source.columns)
 
         with col1:
             if ("business_to_compare" not in st.session_state):        
@@ -219,36 +214,11 @@ def main():
             st.button('전체 기간', on_click = on_click)
                 
                 
-        source = source[(source['이름'].isin(selected_business)) & (source['날짜'].between(pd.to_datetime(date_start), pd.to_datetime(date_end)))]
         if date_start and date_end:
-            for target_feature in target_features:
-                fig = go.Figure()
-                chart = []
-                plot_title = f'{target_feature}'
-                if '증감' in target_feature:
-                    source_to_plot = source.copy().dropna(subset = target_features)
-                    plot_title += f'({period}일 전 대비)'     
-                else:
-                    source_to_plot = source.copy()
-                if source_to_plot[target_feature].dtype == int:
-                    text_auto = True
-                else:
-                    text_auto = '.2f'
-                
-                if '라인' in plot_type:
-                    chart.extend(px.line(data_frame = source_to_plot, x = '날짜', y = target_feature, line_group = '이름', markers = True, color = '이름', title = plot_title, hover_data = ['이름','날짜',target_feature], color_discrete_map = business_colormap).data
-                    )
-                if '바' in plot_type:
-                    chart.extend(px.bar(data_frame = source_to_plot, x = '날짜', y = target_feature, barmode = 'group', text_auto= text_auto, color = '이름', title = plot_title, hover_data = ['이름','날짜',target_feature], opacity=0.5, color_discrete_map = business_colormap).data
-                )
-            
-                for data in chart:
-                    fig.add_trace(data)
-                    # chart.update_xaxes(rangeslider_visible=True)
-                    # st.plotly_chart(chart,use_container_width= True)
-                fig.update_layout(title = plot_title, xaxis_title= "날짜", yaxis_title= target_feature,)
-                fig.update_xaxes(rangeslider_visible=True)    
-                st.plotly_chart(fig,use_container_width= True)
+            with profiling.span('charts', rows = len(target_features)):
+                for target_feature in target_features:
+                    fig = trend_figure(source, target_feature, selected_business, (date_start, date_end), period, plot_type, version = daily_version)
+                    st.plotly_chart(fig,use_container_width= True)
 
     with tab3:
         show_glossary()
@@ -261,7 +231,9 @@ st.set_page_config(
     })
 
 if check_password():
-    main()
+    with profiling.rerun('main'):
+        main()
+    profiling.profile_panel()
 
 with st.sidebar:
     st.info('''문의 및 요청  
@@ -5,8 +5,11 @@ def check_password():
 
     def password_entered():
         """Checks whether a password entered by the user is correct."""
-        if st.session_state["password"] == st.secrets["WBA9"]["password"]:
+        admin_password = st.secrets["WBA9"].get("admin_password")
+        is_admin = bool(admin_password) and st.session_state["password"] == admin_password
+        if is_admin or st.session_state["password"] == st.secrets["WBA9"]["password"]:
             st.session_state["password_correct"] = True
+            st.session_state["is_admin"] = is_admin
             del st.session_state["password"]  # don't store password
         else:
             st.session_state["password_correct"] = False
@@ -28,9 +31,14 @@ def check_password():
         # Password correct.
         return True
 
+def is_admin():
+    """`True` if the user signed in with the admin password ([WBA9] admin_password in secrets.toml)."""
+    return st.session_state.get("password_correct", False) and st.session_state.get("is_admin", False)
+
 def signout():
     def signout_pressed():
         del st.session_state["password_correct"]
+        st.session_state.pop("is_admin", None)
         
     st.button("Sign out", on_click = signout_pressed)
     
@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+BENCH_PERIOD_SETS = ((1,), (7,), (1, 7, 28, 90))
+BENCH_END = pd.Timestamp('2022-12-26')  # a Monday, so the last day closes a report week
+
+def synthetic_daily_summary(n_accounts:int = 14, n_days:int = 365, end = BENCH_END, seed:int = 0):
+    """daily_summary rows of `n_accounts` accounts over the `n_days` days up to `end`, counts as random walks."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(end = end, periods = n_days, freq = 'D')
+    names = [f'account_{i:03d}' for i in range(n_accounts)]
+    shape = (n_accounts, n_days)
+
+    def walk(start, step):
+        return np.maximum(start[:, None] + np.cumsum(rng.integers(-step, 2 * step + 1, size = shape), axis = 1), 1)
+
+    df = pd.DataFrame({
+        'name': np.repeat(names, n_days),
+        'date': np.tile(dates, n_accounts),
+        'followers_count': walk(rng.integers(1000, 100000, n_accounts), 20).ravel(),
+        'follows_count': walk(rng.integers(10, 2000, n_accounts), 2).ravel(),
+        'media_count': walk(rng.integers(10, 3000, n_accounts), 1).ravel(),
+        'like_count': walk(rng.integers(100, 50000, n_accounts), 50).ravel(),
+        'comments_count': walk(rng.integers(10, 5000, n_accounts), 5).ravel(),
+    })
+    df.insert(0, 'id', np.arange(1, len(df) + 1))
+    df['biography'] = 'bio of ' + df['name']
+    df['website'] = 'https://example.com/' + df['name']
+    df['profile_picture_url'] = 'https://example.com/img/' + df['name'] + '.jpg'
+    return df
+
+def synthetic_media(n_accounts:int = 14, n_posts:int = 500, n_days:int = 365, end = BENCH_END, seed:int = 0):
+    """latest_media rows with `n_posts` posts per account spread over the `n_days` days up to `end`."""
+    rng = np.random.default_rng(seed)
+    n = n_accounts * n_posts
+    names = np.repeat([f'account_{i:03d}' for i in range(n_accounts)], n_posts)
+    timestamp = pd.Timestamp(end) + pd.Timedelta(hours = 12) - pd.to_timedelta(rng.integers(0, n_days * 24 * 3600, n), unit = 's')
+    permalink = pd.Series(np.arange(n)).map('https://instagram.com/p/{:08d}'.format)
+    return pd.DataFrame({
+        'name': names,
+        'timestamp': timestamp,
+        'date': pd.Timestamp(end),
+        'media_type': rng.choice(['IMAGE', 'VIDEO', 'CAROUSEL_ALBUM'], n),
+        'media_url': permalink + '/media',
+        'permalink': permalink,
+        'like_count': rng.integers(0, 2000, n),
+        'comments_count': rng.integers(0, 100, n),
+        'caption': 'caption ' + permalink,
+    })
+
+def timeit(func, repeat:int = 5, setup = None):
+    """Wall time of `func()` over `repeat` runs, `setup()` running untimed before each of them."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times), 'repeat': repeat}
+
+def _warm(name:str, func, repeat:int, prefix:str):
+    """timeit of a warm call, checking that every run was served from the shared store entries of `prefix`."""
+    from modules.shared import shared_store
+
+    def hits():
+        return shared_store().counters().get(prefix, {}).get('hits', 0)
+    before = hits()
+    result = timeit(func, repeat)
+    assert hits() - before >= repeat, f'{name} missed the shared store'
+    return result
+
+def _cold():
+    """Empties the in-process stores, so the next call reads and builds everything again."""
+    from modules.cube import _cube_store
+    from modules.db import invalidate
+    from modules.shared import shared_store
+
+    shared_store().clear()
+    _cube_store.clear()
+    invalidate()
+
+def _bench_summary(df_daily, repeat):
+    from modules.stats import Summary
+
+    results = {'summary_init': timeit(lambda: Summary(df_daily.copy()), repeat)}
+    for periods in BENCH_PERIOD_SETS:
+        name = 'get_summaries_' + '_'.join(map(str, periods))
+        results[name] = timeit(lambda: Summary(df_daily.copy()).get_summaries(['diff', 'pct_change'], periods), repeat)
+    return results
+
+def _bench_text(df_daily, repeat):
+    from modules.dates import week_labels
+    from modules.stats import Summary
+    from modules.text import get_week_num, translate, _translate_columns, _translate_name
+
+    columns = Summary(df_daily.copy()).get_summaries(['diff', 'pct_change'], [1, 7]).columns
+
+    def cold():
+        _translate_columns.cache_clear()
+        _translate_name.cache_clear()
+    dates = pd.DatetimeIndex(df_daily['date'].unique())
+    return {
+        'translate_cold': timeit(lambda: translate(columns), repeat, setup = cold),
+        'translate_warm': timeit(lambda: translate(columns), repeat),
+        'get_week_num': timeit(lambda: [get_week_num(d) for d in dates], repeat),
+        'week_labels': timeit(lambda: week_labels(dates), repeat),
+    }
+
+def _bench_reports(df_daily, media, workdir, repeat):
+    from modules.report_batch import build_week_artifacts, weekly_summaries
+    from modules.weekly import WeeklySummary
+
+    cube_path = os.path.join(workdir, 'cube.parquet')
+    report_root = os.path.join(workdir, 'reports')
+    report_end = pd.Timestamp(df_daily['date'].max()).normalize()
+
+    def prepare():
+        weekly = WeeklySummary(weekly_summaries(df_daily, cube_path))
+        build_week_artifacts(weekly, media, report_end, report_root)
+
+    def cold():
+        _cold()
+        if os.path.exists(cube_path):
+            os.remove(cube_path)
+    return {
+        'reports_prep_cold': timeit(prepare, repeat, setup = cold),
+        'reports_prep_warm': _warm('reports_prep_warm', prepare, repeat, 'weekly_summaries'),
+    }
+
+def _bench_db(df_daily, media, workdir, repeat):
+    """load_data/load_window against a SQLite stand-in of the MySQL database, via DB_URL."""
+    from sqlalchemy import create_engine
+    import modules.db as db
+    from modules.cache import DiskCache
+
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    engine = create_engine(url)
+    df_daily.to_sql('daily_summary', engine, index = False, if_exists = 'replace', chunksize = 10000)
+    media.to_sql('latest_media', engine, index = False, if_exists = 'replace', chunksize = 10000)
+    engine.dispose()
+
+    previous_url, previous_cache = os.environ.get(db.DB_URL_ENV), db.disk_cache
+    os.environ[db.DB_URL_ENV] = url
+    db.disk_cache = DiskCache(os.path.join(workdir, 'frames'))
+    week_start = pd.Timestamp(df_daily['date'].max()) - pd.Timedelta(days = 7)
+    try:
+        def cold():
+            _cold()
+            db.disk_cache.clear()
+        return {
+            'load_data_cold': timeit(lambda: db.load_data('daily_summary'), repeat, setup = cold),
+            'load_data_warm': _warm('load_data_warm', lambda: db.load_data('daily_summary'), repeat, 'table'),
+            'load_window_week': timeit(lambda: db.load_window('latest_media', columns = db.MEDIA_COLUMNS, start = week_start), repeat, setup = cold),
+        }
+    finally:
+        _cold()
+        db.disk_cache = previous_cache
+        if previous_url is None:
+            os.environ.pop(db.DB_URL_ENV, None)
+        else:
+            os.environ[db.DB_URL_ENV] = previous_url
+
+def run(n_accounts:int = 14, n_days:int = 365, n_posts:int = 500, repeat:int = 5, seed:int = 0, suites:iter = ('summary', 'text', 'reports', 'db')):
+    """Runs the benchmark suites on synthetic data of the given scale.
+
+    Returns:
+        dict: {'params', 'env', 'results'}, where results maps each benchmark to its min/median/mean seconds
+    """
+    df_daily = synthetic_daily_summary(n_accounts, n_days, seed = seed)
+    media = synthetic_media(n_accounts, n_posts, n_days, seed = seed)
+    workdir = tempfile.mkdtemp(prefix = 'bench-')
+    results = dict()
+    try:
+        if 'summary' in suites:
+            results.update(_bench_summary(df_daily, repeat))
+        if 'text' in suites:
+            results.update(_bench_text(df_daily, repeat))
+        if 'reports' in suites:
+            results.update(_bench_reports(df_daily, media, workdir, repeat))
+        if 'db' in suites:
+            results.update(_bench_db(df_daily, media, workdir, repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors = True)
+    return {
+        'params': {'accounts': n_accounts, 'days': n_days, 'posts': n_posts, 'repeat': repeat, 'seed': seed, 'daily_rows': len(df_daily), 'media_rows': len(media)},
+        'env': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__, 'machine': platform.machine()},
+        'results': results,
+    }
+
+def regressions(report:dict, baseline:dict, tolerance:float = 1.2):
+    """Benchmarks whose median is more than `tolerance` times the baseline's."""
+    slower = dict()
+    for name, result in report['results'].items():
+        base = baseline['results'].get(name)
+        if base and result['median'] > tolerance * base['median']:
+            slower[name] = result['median'] / base['median']
+    return slower
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark the summary, text, report and db hot paths on synthetic data')
+    parser.add_argument('--accounts', type = int, default = 14)
+    parser.add_argument('--days', type = int, default = 365)
+    parser.add_argument('--posts', type = int, default = 500, help = 'posts per account')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--suites', nargs = '+', default = ['summary', 'text', 'reports', 'db'])
+    parser.add_argument('--out', help = 'write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help = 'JSON report to compare against; exits with 1 on regressions')
+    parser.add_argument('--tolerance', type = float, default = 1.2)
+    args = parser.parse_args()
+
+    report = run(args.accounts, args.days, args.posts, args.repeat, suites = args.suites)
+    output = json.dumps(report, indent = 2)
+    if args.out:
+        with open(args.out, 'w', encoding = 'utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline, encoding = 'utf-8') as f:
+            slower = regressions(report, json.load(f), args.tolerance)
+        for name, ratio in slower.items():
+            print(f'{name}: {ratio:.2f}x slower than baseline', file = sys.stderr)
+        sys.exit(1 if slower else 0)
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import pandas as pd
+
+CACHE_DIR = '.cache/frames'
+# Entries not read or written for this many seconds are deleted, checked at most once per PRUNE_INTERVAL
+CACHE_MAX_AGE = 7 * 24 * 3600
+PRUNE_INTERVAL = 3600
+
+class DiskCache():
+    """Parquet files of loaded frames, kept across restarts and redeploys.
+
+    Each entry is a `<name>-<digest>.parquet` file with a JSON sidecar holding the time it
+    was written and the freshness token (the db data-version token) it was loaded at. An
+    entry is reused exactly when its token matches the current one.
+    Each entry is read and written under its own lock, so a reader never pairs the parquet
+    file of one write with the sidecar of another. Entries unused for `max_age` seconds are
+    deleted (see prune).
+    """
+    def __init__(self, cache_dir:str = CACHE_DIR, max_age:float = CACHE_MAX_AGE):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # One lock per entry path ever used. They are never dropped, so two threads can't end up with different locks for one entry.
+        self._locks = dict()
+        self._prune_lock = threading.Lock()
+        self._pruned_at = 0
+
+    def _paths(self, key:tuple):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(self.cache_dir, f'{key[0]}-{digest}')
+        return base + '.parquet', base + '.json'
+
+    def _path_lock(self, path:str):
+        with self._lock:
+            return self._locks.setdefault(path, threading.RLock())
+
+    def _key_lock(self, key:tuple):
+        return self._path_lock(self._paths(key)[0])
+
+    def read_meta(self, key:tuple):
+        """Returns the sidecar of the entry, or None when there is none."""
+        path, meta_path = self._paths(key)
+        with self._key_lock(key):
+            if not (os.path.exists(path) and os.path.exists(meta_path)):
+                return None
+            with open(meta_path, encoding = 'utf-8') as f:
+                return json.load(f)
+
+    def _read_frame(self, key:tuple):
+        path = self._paths(key)[0]
+        df = pd.read_parquet(path)
+        os.utime(path)  # marks the entry as used, see prune
+        return df
+
+    def read(self, key:tuple):
+        """Returns (frame, meta) of the entry, or (None, None) when there is none."""
+        with self._key_lock(key):
+            meta = self.read_meta(key)
+            if meta is None:
+                return None, None
+            return self._read_frame(key), meta
+
+    def _write(self, key:tuple, df:pd.DataFrame, token):
+        path, meta_path = self._paths(key)
+        os.makedirs(self.cache_dir, exist_ok = True)
+        with self._key_lock(key):
+            df.to_parquet(path + '.tmp', index = False)
+            os.replace(path + '.tmp', path)
+            with open(meta_path + '.tmp', 'w', encoding = 'utf-8') as f:
+                json.dump({'written_at': time.time(), 'token': token}, f)
+            os.replace(meta_path + '.tmp', meta_path)
+
+    def write(self, key:tuple, df:pd.DataFrame, token = None):
+        self._write(key, df, token)
+        self._maybe_prune()
+
+    def get(self, key:tuple, loader, token):
+        """Returns the cached frame for `key`, calling `loader()` only when the entry was written at another token.
+
+        Args:
+            key (tuple): Cache key, starting with the table name
+            loader (callable): Returns the fresh frame
+            token: The current JSON-serializable freshness token, e.g. db.table_version()
+
+        Returns:
+            pd.DataFrame: The frame
+        """
+        with self._key_lock(key):
+            meta = self.read_meta(key)
+            if meta is not None and meta['token'] == token:
+                return self._read_frame(key)
+            df = loader()
+            self._write(key, df, token)
+        # Outside the entry lock: prune takes other entries' locks
+        self._maybe_prune()
+        return df
+
+    def _maybe_prune(self):
+        if time.time() - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+
+    def prune(self, max_age:float = None):
+        """Deletes the entries, and leftover .tmp files, not read or written for `max_age` seconds.
+
+        Entries another thread is reading or writing are skipped, and only one thread prunes at a time.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        if not self._prune_lock.acquire(blocking = False):
+            return
+        try:
+            self._pruned_at = time.time()
+            if not os.path.isdir(self.cache_dir):
+                return
+            for file_name in os.listdir(self.cache_dir):
+                if not file_name.endswith(('.parquet', '.tmp')):
+                    continue
+                path = os.path.join(self.cache_dir, file_name)
+                # Leftover .parquet.tmp/.json.tmp files belong to the entry of the same name
+                entry_path = re.sub(r'\.(parquet|json)\.tmp$', '.parquet', path)
+                lock = self._path_lock(entry_path)
+                if not lock.acquire(blocking = False):
+                    continue
+                try:
+                    if os.path.exists(path) and time.time() - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                        meta_path = path[:-len('.parquet')] + '.json'
+                        if file_name.endswith('.parquet') and os.path.exists(meta_path):
+                            os.remove(meta_path)
+                finally:
+                    lock.release()
+        finally:
+            self._prune_lock.release()
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for file_name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, file_name))
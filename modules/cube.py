@@ -0,0 +1,162 @@
+import argparse
+import itertools
+import os
+import threading
+import pandas as pd
+from modules import profiling
+from modules.schema import apply_schema
+from modules.shared import freeze, process_singleton, shared_store, view
+from modules.stats import Summary, append_day, state_tail
+
+CUBE_PATH = 'data/summary_cube.parquet'
+CUBE_PERIODS = (1, 7, 28, 90)
+SUMMARY_FUNCS = ['diff', 'pct_change']
+_cube_versions = itertools.count()
+
+def build_cube(df_daily:pd.DataFrame, periods:iter = CUBE_PERIODS):
+    """Computes the summaries of every period as one long frame keyed by (date, name, period)."""
+    summarizer = Summary(df_daily.sort_values('date'))
+    blocks = []
+    for p in periods:
+        block = summarizer.get_summaries(summary_func = SUMMARY_FUNCS, periods = [p])
+        block.insert(0, 'period', p)
+        blocks.append(block)
+    return pd.concat(blocks, ignore_index = True)
+
+def read_cube(path:str = CUBE_PATH):
+    if not os.path.exists(path):
+        return None
+    return apply_schema(pd.read_parquet(path), 'daily_summary')
+
+def write_cube(cube:pd.DataFrame, path:str = CUBE_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    tmp_path = path + '.tmp'
+    cube.to_parquet(tmp_path, index = False)
+    os.replace(tmp_path, path)
+
+def materialize_cube(df_daily:pd.DataFrame, periods:iter = CUBE_PERIODS, path:str = CUBE_PATH):
+    """Brings the stored cube up to date with `df_daily`.
+
+    Dates from the last materialized one (inclusive, so a partial day completed later is
+    picked up) are computed again, one day at a time with append_day against the cube rows
+    before them, so a daily update never touches the rest of the history. Older dates of
+    `df_daily` whose row count differs from the cube's (rows that arrived late) move that
+    start further back. The cube is rebuilt from scratch when it is missing or lacks one of
+    `periods`, and only then does `df_daily` need to hold the full history.
+
+    Args:
+        df_daily (pd.DataFrame): Raw daily_summary rows, at least those from the last materialized date on
+        periods (iterable, optional): Periods to materialize
+        path (str, optional): Parquet file holding the cube
+
+    Returns:
+        pd.DataFrame: The full cube
+    """
+    df_daily = apply_schema(df_daily, 'daily_summary')
+    cube = read_cube(path)
+    if cube is not None and set(periods) <= set(cube['period'].unique()):
+        cube_periods = sorted(cube['period'].unique())
+        base = cube.loc[cube['period'] == cube_periods[0]]
+        daily_counts = df_daily.groupby('date').size()
+        cube_counts = base.groupby('date').size().reindex(daily_counts.index, fill_value = 0)
+        changed = daily_counts.index[(daily_counts.index >= base['date'].max()) | (daily_counts != cube_counts)]
+        if changed.empty:
+            return cube
+        since = changed.min()
+        if not (base['date'] < since).any():
+            cube = build_cube(df_daily, periods)
+        else:
+            base_columns = [c for c in cube.columns if c != 'period' and not c.endswith(('_diff', '_pct_change'))]
+            state = state_tail(base.loc[base['date'] < since, base_columns], cube_periods)
+            fresh = []
+            for _, new_day in df_daily.loc[df_daily['date'] >= since].groupby('date'):
+                for p in cube_periods:
+                    block = append_day(state, new_day, SUMMARY_FUNCS, [p])
+                    block.insert(0, 'period', p)
+                    fresh.append(block)
+                state = state_tail(pd.concat([state, block[base_columns]]), cube_periods)
+            cube = apply_schema(pd.concat([cube.loc[cube['date'] < since]] + fresh, ignore_index = True), 'daily_summary')
+    else:
+        cube = build_cube(df_daily, periods)
+    write_cube(cube, path)
+    return cube
+
+class SummaryCube():
+    def __init__(self, cube:pd.DataFrame):
+        self.periods = sorted(cube['period'].unique())
+        self.last_date = cube['date'].max()
+        # New for every materialization, since late rows can change the cube without moving last_date
+        self.version = next(_cube_versions)
+        self._slices = {p: freeze(df.drop(columns = 'period').reset_index(drop = True)) for p, df in cube.groupby('period')}
+
+    def slice(self, period:int, dates = None, names = None):
+        """Returns the rows of `period` in the shape of Summary.get_summaries(periods = [period]).
+
+        The full slice is a read-only view shared by every session, filtered slices are copies.
+        """
+        df = self._slices[period]
+        if dates is None and names is None:
+            return view(df)
+        mask = pd.Series(True, index = df.index)
+        if dates is not None:
+            mask &= df['date'].isin(pd.to_datetime(dates))
+        if names is not None:
+            mask &= df['name'].isin(names)
+        return df.loc[mask]
+
+@process_singleton
+def _cube_store(path:str):
+    return {'lock': threading.Lock(), 'cube': None, 'token': None}
+
+def load_summary_cube(df_daily:pd.DataFrame, periods:iter = CUBE_PERIODS, path:str = CUBE_PATH, version = None):
+    """Returns the process-wide SummaryCube of `path`, materializing it again only when `df_daily` changed.
+
+    Args:
+        df_daily (pd.DataFrame): Raw daily_summary rows
+        periods (iterable, optional): Periods to materialize
+        path (str, optional): Parquet file holding the cube
+        version (optional): Data version of `df_daily`, e.g. table_version('daily_summary').
+            Without it the frame's contents are hashed, so rewritten counts are never missed.
+    """
+    store = _cube_store(path)
+    if version is None:
+        token = ('hash', int(pd.util.hash_pandas_object(df_daily, index = False).sum()))
+    else:
+        token = ('version', version)
+    with store['lock']:
+        if store['cube'] is None or store['token'] != token:
+            store['cube'] = SummaryCube(materialize_cube(df_daily, periods, path))
+            store['token'] = token
+        return store['cube']
+
+@profiling.profiled('get_summary_slice')
+def get_summary_slice(df_daily:pd.DataFrame, period:int, version = None):
+    """Slice of the cube for `period`, falling back to a full Summary for periods that are not materialized.
+
+    Summaries computed in the fallback are kept in the shared store, so each period is
+    computed once per process and data version rather than once per session. `version` is
+    the data version of `df_daily`, see load_summary_cube.
+    """
+    cube = load_summary_cube(df_daily, version = version)
+    if period in cube.periods:
+        return cube.slice(period)
+
+    def build():
+        df = apply_schema(df_daily, 'daily_summary')
+        return Summary(df.sort_values('date')).get_summaries(summary_func = SUMMARY_FUNCS, periods = [period])
+    return shared_store().get(('summary', period), build, version = cube.version)
+
+if __name__ == '__main__':
+    from modules.db import load_data, load_window
+
+    parser = argparse.ArgumentParser(description = 'Materialize the daily summary cube')
+    parser.add_argument('--periods', type = int, nargs = '+', default = list(CUBE_PERIODS))
+    parser.add_argument('--path', default = CUBE_PATH)
+    args = parser.parse_args()
+    cube = read_cube(args.path)
+    if cube is not None and set(args.periods) <= set(cube['period'].unique()):
+        df_daily = load_window('daily_summary', start = cube['date'].max())
+    else:
+        df_daily = load_data('daily_summary')
+    cube = materialize_cube(df_daily, args.periods, args.path)
+    print(f"{len(cube)} rows up to {cube['date'].max():%Y-%m-%d} in {args.path}")
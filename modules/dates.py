@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+
+KST = timezone(timedelta(hours = 9))
+REPORT_INIT = datetime(2022, 10, 3, 12, 0, tzinfo = KST)
+REPORT_DAYS = 7
+
+def _week_numbers(day, first_weekday, ref_weekday):
+    """Number of `ref_weekday`s from the 1st of the month up to `day`, inclusive."""
+    first_ref_day = 1 + (ref_weekday - first_weekday) % 7
+    return np.where(day >= first_ref_day, (day - first_ref_day) // 7 + 1, 0)
+
+@lru_cache(maxsize = 4096)
+def _week_label(year:int, month:int, day:int, first_weekday:int, ref_weekday:int):
+    n = int(_week_numbers(day, first_weekday, ref_weekday))
+    return f'{year}년 {month}월 {n}주차'
+
+def week_label(date, ref_weekday:int = 0):
+    """'YYYY년 M월 N주차', where N counts the `ref_weekday`s (Monday by default) so far in the month."""
+    date = pd.to_datetime(date)
+    first_weekday = (date.dayofweek - (date.day - 1)) % 7
+    return _week_label(date.year, date.month, date.day, first_weekday, ref_weekday)
+
+def week_labels(dates, ref_weekday:int = 0):
+    """week_label for a whole DatetimeIndex in one vectorized call."""
+    dates = pd.DatetimeIndex(dates)
+    day = dates.day.to_numpy()
+    first_weekday = (dates.dayofweek.to_numpy() - (day - 1)) % 7
+    n = pd.Index(_week_numbers(day, first_weekday, ref_weekday))
+    return dates.year.astype(str) + '년 ' + dates.month.astype(str) + '월 ' + n.astype(str) + '주차'
+
+def get_report_period(start = REPORT_INIT, end = None):
+    """Report dates every REPORT_DAYS days from `start` up to `end` (now in KST by default)."""
+    if end is None:
+        end = datetime.now(tz = KST)
+    return pd.date_range(start = pd.to_datetime(start), end = pd.to_datetime(end), freq = f'{REPORT_DAYS}D')
+
+def report_bounds(report_end, days:int = REPORT_DAYS):
+    """(start, end) of the report period ending on `report_end`."""
+    report_end = pd.to_datetime(report_end)
+    return report_end - timedelta(days = days), report_end
@@ -1,31 +1,505 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, func, inspect, select, table, column, literal_column, Column, DateTime, Index, MetaData, String, Table, Text
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import QueuePool
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+import os
+import re
 import pandas as pd
 import streamlit as st
+import threading
+import time
+from modules.cache import DiskCache
+from modules import profiling
+from modules.schema import apply_schema
+from modules.shared import freeze, process_singleton, shared_store, view
 
-@st.experimental_singleton
-def _connect_db():
-    db_connection_str = f"mysql+pymysql://{st.secrets['DB']['user']}:{st.secrets['DB']['pw']}@{st.secrets['DB']['host']}/{st.secrets['DB']['db_name']}"
-    db_connection = create_engine(db_connection_str)
-    conn = db_connection.connect()
+# (time column, account column) of each table, used for window and account predicates
+TABLE_KEYS = {
+    'daily_summary': ('date', 'name'),
+    'latest_media': ('timestamp', 'name'),
+    'weekly_summary': ('날짜', '이름'),
+    'weekly_media': ('timestamp', 'name'),
+    'test_weekly_media': ('timestamp', 'name'),
+}
+
+# Natural key of each table, used by upsert_data to overwrite instead of duplicating rows
+UPSERT_KEYS = {
+    'daily_summary': ['date', 'name'],
+    'latest_media': ['permalink'],
+    'weekly_summary': ['날짜', '이름'],
+    'weekly_media': ['permalink'],
+}
+
+# Columns of the media tables the pages read, leaving out ids and other unused fields
+MEDIA_COLUMNS = ('name', 'timestamp', 'date', 'media_type', 'media_url', 'permalink', 'like_count', 'comments_count', 'caption')
+
+# Row per table, rewritten by upsert_data after every write. Cached reads are keyed on it.
+VERSION_TABLE = 'data_version'
+# Seconds a version token is trusted before the database is asked again
+VERSION_CHECK_INTERVAL = 30
+
+data_version = Table(
+    VERSION_TABLE, MetaData(),
+    Column('table_name', String(64), primary_key = True),
+    Column('version', String(64), nullable = False),
+    Column('updated_at', DateTime, nullable = False),
+)
+
+WriteResult = namedtuple('WriteResult', ['rows', 'elapsed'])
+
+class DuplicateKeyError(RuntimeError):
+    """A table holds duplicate rows on its natural key, so its UNIQUE index cannot be created. See dedupe_table."""
+
+# Pool settings, each can be overridden by the same key under [DB] in secrets.toml
+POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800,
+    'pool_pre_ping': True,
+}
+
+# Any SQLAlchemy URL (e.g. sqlite:///bench.db) in this variable replaces the MySQL database of secrets.toml
+DB_URL_ENV = 'DB_URL'
+
+disk_cache = DiskCache()
+
+_pool_stats = {'lock': threading.Lock(), 'checkouts': 0, 'connects': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+
+def _pool_options():
+    return {k: st.secrets['DB'].get(k, v) for k, v in POOL_OPTIONS.items()}
+
+def _count_connect(dbapi_connection, connection_record):
+    with _pool_stats['lock']:
+        _pool_stats['connects'] += 1
+
+@process_singleton
+def _engine(db_url:str):
+    if db_url == os.environ.get(DB_URL_ENV):
+        db_connection = create_engine(db_url)
+    else:
+        db_connection = create_engine(db_url, **_pool_options())
+    event.listen(db_connection, 'connect', _count_connect)
     return db_connection
 
-@st.experimental_memo(ttl=600)
+def _connect_db():
+    """The engine of DB_URL when it is set, else of the MySQL database in secrets.toml. One per URL and process."""
+    if os.environ.get(DB_URL_ENV):
+        return _engine(os.environ[DB_URL_ENV])
+    return _engine(f"mysql+pymysql://{st.secrets['DB']['user']}:{st.secrets['DB']['pw']}@{st.secrets['DB']['host']}/{st.secrets['DB']['db_name']}")
+
+def _record_checkout(wait):
+    with _pool_stats['lock']:
+        _pool_stats['checkouts'] += 1
+        _pool_stats['wait_total'] += wait
+        _pool_stats['wait_max'] = max(_pool_stats['wait_max'], wait)
+
+@contextmanager
+def read_connection():
+    """Checks a connection out of the pool for reads and returns it on exit."""
+    started = time.perf_counter()
+    with _connect_db().connect() as conn:
+        _record_checkout(time.perf_counter() - started)
+        yield conn
+
+@contextmanager
+def write_connection():
+    """Checks a connection out of the pool inside a transaction, committed on exit."""
+    started = time.perf_counter()
+    with _connect_db().begin() as conn:
+        _record_checkout(time.perf_counter() - started)
+        yield conn
+
+def pool_stats():
+    """Returns checkout/wait counters and the current state of the connection pool."""
+    with _pool_stats['lock']:
+        stats = {k: v for k, v in _pool_stats.items() if k != 'lock'}
+    stats['wait_mean'] = stats['wait_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    pool = _connect_db().pool
+    if isinstance(pool, QueuePool):
+        stats.update(size = pool.size(), checked_in = pool.checkedin(), checked_out = pool.checkedout(), overflow = pool.overflow())
+    return stats
+
+def _bound_time(value):
+    """Converts a date-like bound into a naive datetime in the stored (KST wall clock) time."""
+    value = pd.to_datetime(value)
+    if value.tzinfo is not None:
+        value = value.tz_localize(None)
+    return value.to_pydatetime()
+
+def _build_select(db_name:str, columns = None, start = None, end = None, names = None, after = None):
+    """Builds a parameterized SELECT on `db_name`.
+
+    Args:
+        db_name (str): Table name
+        columns (iterable, optional): Columns to select. All columns if not given.
+        start, end (optional): Inclusive bounds on the table's time column
+        names (iterable, optional): Accounts to keep
+        after (optional): Exclusive lower bound on the time column (high-water mark)
+
+    Returns:
+        sqlalchemy.sql.Select: The query, with every value passed as a bound parameter
+    """
+    time_col, name_col = TABLE_KEYS.get(db_name, ('date', 'name'))
+    if columns:
+        query = select(*[column(c) for c in columns])
+    else:
+        query = select(literal_column('*'))
+    query = query.select_from(table(db_name))
+    time_column = column(time_col, DateTime)
+    if start is not None:
+        query = query.where(time_column >= _bound_time(start))
+    if end is not None:
+        query = query.where(time_column <= _bound_time(end))
+    if after is not None:
+        query = query.where(time_column > _bound_time(after))
+    if names:
+        query = query.where(column(name_col).in_(list(names)))
+    return query
+
+def _read_sql(sql, db_name:str):
+    with read_connection() as conn:
+        df = pd.read_sql(sql = sql, con = conn)
+    return apply_schema(df, db_name)
+
+def probe_table(db_name:str):
+    """Cheap freshness token of a table: the latest value of its time column and its row count."""
+    time_col = TABLE_KEYS.get(db_name, ('date', 'name'))[0]
+    query = select(func.max(column(time_col)), func.count()).select_from(table(db_name))
+    with read_connection() as conn:
+        latest, n_rows = conn.execute(query).one()
+    return [str(latest), n_rows]
+
+@process_singleton
+def _version_store():
+    return {'lock': threading.Lock(), 'tokens': dict(), 'checks': 0, 'has_table': set()}
+
+def _read_version(db_name:str, store:dict):
+    with read_connection() as conn:
+        # Remembered per database, since DB_URL can point the same process at another one
+        db_url = str(conn.engine.url)
+        if db_url not in store['has_table'] and inspect(conn).has_table(VERSION_TABLE):
+            store['has_table'].add(db_url)
+        if db_url in store['has_table']:
+            version = conn.execute(select(data_version.c.version).where(data_version.c.table_name == db_name)).scalar()
+            if version is not None:
+                return ['version', version]
+    return ['probe'] + probe_table(db_name)
+
+def table_version(db_name:str, max_age:float = VERSION_CHECK_INTERVAL):
+    """Data-version token of `db_name`: its data_version row, or probe_table for tables never written through upsert_data.
+
+    The database is asked at most once per `max_age` seconds per process, whatever the number of sessions.
+    """
+    store = _version_store()
+    with store['lock']:
+        cached = store['tokens'].get(db_name)
+        if cached is not None and time.time() - cached[1] < max_age:
+            return cached[0]
+        token = _read_version(db_name, store)
+        store['checks'] += 1
+        store['tokens'][db_name] = (token, time.time())
+        return token
+
+def invalidate(db_name:str = None):
+    """Forgets the version token of `db_name` (of every table by default), so the next read checks the database."""
+    store = _version_store()
+    with store['lock']:
+        if db_name is None:
+            store['tokens'].clear()
+        else:
+            store['tokens'].pop(db_name, None)
+
+def bump_version(db_name:str, conn):
+    """Writes a new data_version row for `db_name`, invalidating the cached reads of every process."""
+    data_version.create(conn, checkfirst = True)
+    values = {'table_name': db_name, 'version': f'{time.time():.6f}', 'updated_at': datetime.now()}
+    if conn.dialect.name == 'mysql':
+        stmt = mysql_insert(data_version).values(**values)
+        stmt = stmt.on_duplicate_key_update(version = stmt.inserted.version, updated_at = stmt.inserted.updated_at)
+    elif conn.dialect.name == 'sqlite':
+        stmt = sqlite_insert(data_version).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements = ['table_name'], set_ = {'version': stmt.excluded.version, 'updated_at': stmt.excluded.updated_at})
+    else:
+        conn.execute(data_version.delete().where(data_version.c.table_name == db_name))
+        stmt = data_version.insert().values(**values)
+    conn.execute(stmt)
+
+def cache_stats():
+    """Hit/miss counters of the cached reads, the number of version checks and the current tokens."""
+    store = _version_store()
+    with store['lock']:
+        versions = {db_name: token for db_name, (token, _) in store['tokens'].items()}
+        checks = store['checks']
+    return {'reads': shared_store().counters(), 'version_checks': checks, 'versions': versions}
+
+def _load_table(db_name:str):
+    token = table_version(db_name)
+
+    def load():
+        df = disk_cache.get((db_name, 'table'), loader = lambda: _read_sql(_build_select(db_name), db_name), token = token)
+        return apply_schema(df, db_name)
+    return shared_store().get(('table', db_name), load, version = token)
+
+@profiling.profiled('load_data', cached = True)
 def load_data(db_names:str|list):
-    db_connection = _connect_db()
+    """Loads whole tables, read from the database once per process and data version (see table_version).
+
+    Concurrent sessions missing the same table wait for a single read and share its result.
+    """
     if isinstance(db_names, str):
-        return pd.read_sql_table(table_name = db_names, con = db_connection)
+        return _load_table(db_names)
     else:
         df_list = []
         for db_name in db_names:
-            df_list.append(pd.read_sql_table(table_name = db_name, con = db_connection))
+            df_list.append(_load_table(db_name))
         return df_list
 
-@st.experimental_memo(ttl=600)   
+def _normalize_query(db_name, columns, start, end, after, names):
+    """Canonical form of a query so that equivalent requests share one cache entry."""
+    def bound(value):
+        return None if value is None else _bound_time(value).isoformat()
+    return (
+        db_name,
+        tuple(sorted(set(columns))) if columns else None,
+        bound(start), bound(end), bound(after),
+        tuple(sorted(set(names))) if names else None,
+    )
+
+def _cached_query(db_name, columns, start, end, after, names):
+    token = table_version(db_name)
+    key = (db_name, 'query', columns, start, end, after, names)
+
+    def load():
+        df = disk_cache.get(key, loader = lambda: _read_sql(_build_select(db_name, columns, start, end, names, after), db_name), token = token)
+        return apply_schema(df, db_name)
+    return shared_store().get(('query',) + key, load, version = token)
+
+@profiling.profiled('load_window', cached = True)
+def load_window(db_name:str, columns:iter = None, start = None, end = None, names:iter = None, after = None):
+    """Loads only the rows of `db_name` inside the date window and account filter.
+
+    Column and name order, duplicates and the type of the time bounds do not change the cache key.
+    Results are cached per data version of the table, like load_data.
+
+    Args:
+        db_name (str): Table name
+        columns (iterable, optional): Columns to select
+        start, end (optional): Inclusive bounds on the table's time column
+        names (iterable, optional): Accounts to keep
+        after (optional): Exclusive lower bound on the time column
+
+    Returns:
+        pd.DataFrame: The selected rows, with columns in the requested order
+    """
+    df = _cached_query(*_normalize_query(db_name, columns, start, end, after, names))
+    if columns:
+        df = df[list(dict.fromkeys(columns))]
+    return df
+
+@process_singleton
+def _table_store():
+    return {'lock': threading.Lock(), 'tables': dict(), 'unique_keys': set(), 'duplicate_keys': set()}
+
+@profiling.profiled('refresh_data')
+def refresh_data(db_name:str, columns:list = None, names:list = None):
+    """Loads `db_name` once, then only re-reads the rows from the cached high-water mark on.
+
+    Rows are fetched only when the table's data version changed (see table_version). Rows at the
+    high-water mark are fetched again and replace the cached ones, so an upsert rewriting the
+    latest date reaches the frame. When the mark did not advance, the change was to older rows
+    and the table is read again in full.
+    The frame is also kept on disk, so a restarted process only fetches the rows changed since.
+    Every session gets a read-only view of the same frame (see modules.shared), not a copy.
+
+    Args:
+        db_name (str): Table name
+        columns (list, optional): Columns to select. The time column is always included.
+        names (list, optional): Accounts to keep
+
+    Returns:
+        pd.DataFrame: All cached rows of the table, read-only
+    """
+    time_col = TABLE_KEYS.get(db_name, ('date', 'name'))[0]
+    if columns and time_col not in columns:
+        columns = [time_col] + list(columns)
+    key = (db_name, tuple(columns or ()), tuple(sorted(names or ())))
+    disk_key = (db_name, 'refresh') + key[1:]
+    token = table_version(db_name)
+    store = _table_store()
+    with store['lock']:
+        cached = store['tables'].get(key)
+        if cached is None:
+            # Warm start: continue from the frame a previous process left on disk
+            df, meta = disk_cache.read(disk_key)
+            if df is not None:
+                df = apply_schema(df, db_name)
+                cached = {'df': df, 'high_water_mark': df[time_col].max() if len(df) else None, 'version': meta['token']}
+        if cached is not None and cached['version'] == token:
+            df = cached['df']
+        elif cached is None or cached['high_water_mark'] is None:
+            df = _read_sql(_build_select(db_name, columns, names = names), db_name)
+            disk_cache.write(disk_key, df, token)
+        else:
+            high_water_mark = cached['high_water_mark']
+            changed = _read_sql(_build_select(db_name, columns, start = high_water_mark, names = names), db_name)
+            if len(changed) and changed[time_col].max() > high_water_mark:
+                df = cached['df']
+                # Re-applied so `name` stays categorical across the union of both frames' categories
+                df = apply_schema(pd.concat([df.loc[df[time_col] < high_water_mark], changed], ignore_index = True), db_name)
+            else:
+                df = _read_sql(_build_select(db_name, columns, names = names), db_name)
+            disk_cache.write(disk_key, df, token)
+        high_water_mark = df[time_col].max() if len(df) else None
+        store['tables'][key] = {'df': freeze(df), 'high_water_mark': high_water_mark, 'version': token}
+    return view(df)
+
+def _query_tables(query):
+    """Known tables that a raw SQL string mentions."""
+    query = str(query)
+    return sorted(t for t in set(TABLE_KEYS) | set(UPSERT_KEYS) if re.search(rf'\b{re.escape(t)}\b', query))
+
+@profiling.profiled('get_by_query', cached = True)
 def get_by_query(query):
-    db_connection = _connect_db()
-    return pd.read_sql(sql= query, con = db_connection)
+    """Runs a raw SQL query, cached per data version of the tables it mentions.
+
+    Queries on other tables keep the former behaviour of being re-run every 10 minutes.
+    """
+    tables = _query_tables(query)
+    version = [table_version(t) for t in tables] if tables else int(time.time() // 600)
+
+    def load():
+        with read_connection() as conn:
+            return pd.read_sql(sql= query, con = conn)
+    return shared_store().get(('sql', str(query)), load, version = version)
+
+def _upsert_method(key):
+    """Builds a DataFrame.to_sql method that writes each chunk as one multi-row upsert on `key`."""
+    def upsert(pd_table, conn, keys, data_iter):
+        rows = [dict(zip(keys, row)) for row in data_iter]
+        if not rows:
+            return 0
+        update_columns = [c for c in keys if c not in key]
+        if conn.dialect.name == 'mysql':
+            stmt = mysql_insert(pd_table.table)
+            stmt = stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in update_columns})
+        elif conn.dialect.name == 'sqlite':
+            stmt = sqlite_insert(pd_table.table)
+            stmt = stmt.on_conflict_do_update(index_elements = key, set_ = {c: stmt.excluded[c] for c in update_columns})
+        else:
+            stmt = pd_table.table.insert()
+        conn.execute(stmt, rows)
+        return len(rows)
+    return upsert
+
+def create_unique_key(db_name:str, key:list, conn = None):
+    """Adds the UNIQUE index on `key` that upsert_data relies on."""
+    if conn is None:
+        with write_connection() as conn:
+            return create_unique_key(db_name, key, conn)
+    tbl = Table(db_name, MetaData(), autoload_with = conn)
+    prefix_lengths = {c: 191 for c in key if isinstance(tbl.c[c].type, Text)}
+    Index(f'uq_{db_name}', *[tbl.c[c] for c in key], unique = True, mysql_length = prefix_lengths).create(conn)
+
+def ensure_unique_key(db_name:str, key:list, conn):
+    """Checks that `db_name` has a UNIQUE index within `key`, creating it when missing. Checked once per process.
+
+    Raises:
+        DuplicateKeyError: When the index is missing and cannot be created, e.g. because the table
+            already holds duplicate rows. Upserting would silently insert more of them. Raised
+            again without asking the database until dedupe_table runs.
+    """
+    store = _table_store()
+    marker = (str(conn.engine.url), db_name, tuple(key))
+    if marker in store['unique_keys']:
+        return
+    if marker in store['duplicate_keys']:
+        raise DuplicateKeyError(f'{db_name} has duplicate rows on {key}. Run `python -m modules.db --dedupe {db_name}` first.')
+    inspector = inspect(conn)
+    unique = [i['column_names'] for i in inspector.get_indexes(db_name) if i['unique']]
+    unique += [c['column_names'] for c in inspector.get_unique_constraints(db_name)]
+    unique.append(inspector.get_pk_constraint(db_name)['constrained_columns'])
+    if not any(columns and set(columns) <= set(key) for columns in unique):
+        try:
+            create_unique_key(db_name, key, conn)
+        except SQLAlchemyError as e:
+            store['duplicate_keys'].add(marker)
+            raise DuplicateKeyError(f'{db_name} has no UNIQUE index on {key} and it could not be created. Run `python -m modules.db --dedupe {db_name}` first.') from e
+    store['unique_keys'].add(marker)
+
+def dedupe_table(db_name:str, key:list = None):
+    """One-off migration of a table written before upsert_data: keeps the last row of each `key` and adds the UNIQUE index.
+
+    Rows are compared in the order the database returns them, which is insertion order for the
+    tables this app writes, so the latest write of each key wins.
+
+    Args:
+        db_name (str): Table name
+        key (list, optional): Natural key columns. Defaults to UPSERT_KEYS[db_name].
+
+    Returns:
+        int: Number of rows removed
+    """
+    key = list(key or UPSERT_KEYS[db_name])
+    with write_connection() as conn:
+        df = pd.read_sql(sql = select(literal_column('*')).select_from(table(db_name)), con = conn)
+        deduped = df.drop_duplicates(subset = key, keep = 'last')
+        if len(deduped) < len(df):
+            tbl = Table(db_name, MetaData(), autoload_with = conn)
+            conn.execute(tbl.delete())
+            deduped.to_sql(name = db_name, con = conn, if_exists = 'append', index = False, chunksize = 1000)
+        store = _table_store()
+        store['duplicate_keys'].discard((str(conn.engine.url), db_name, tuple(key)))
+        ensure_unique_key(db_name, key, conn)
+        bump_version(db_name, conn)
+    invalidate(db_name)
+    return len(df) - len(deduped)
+
+@profiling.profiled('upsert_data')
+def upsert_data(df:pd.DataFrame, db_name:str, key:list = None, chunksize:int = 1000):
+    """Writes `df` to `db_name` in chunked multi-row inserts, updating rows that already exist.
+
+    Writing the same rows twice leaves one copy: the UNIQUE index on `key` this relies on is
+    created with new tables, and added to existing ones on their first upsert (see ensure_unique_key).
+    The table's data_version row is bumped in the same transaction, so cached reads of it are refreshed.
+
+    Args:
+        df (pd.DataFrame): Rows to write
+        db_name (str): Table name
+        key (list, optional): Natural key columns. Defaults to UPSERT_KEYS[db_name].
+        chunksize (int, optional): Rows per INSERT statement
+
+    Returns:
+        WriteResult: Rows written and elapsed seconds
+
+    Raises:
+        DuplicateKeyError: When an existing table holds duplicates on `key` (see dedupe_table)
+    """
+    started = time.perf_counter()
+    key = list(key or UPSERT_KEYS[db_name])
+    df = df.drop_duplicates(subset = key, keep = 'last')
+    with write_connection() as conn:
+        if not inspect(conn).has_table(db_name):
+            df.head(0).to_sql(name = db_name, con = conn, index = False)
+        ensure_unique_key(db_name, key, conn)
+        df.to_sql(name = db_name, con = conn, if_exists = 'append', index = False, chunksize = chunksize, method = _upsert_method(key))
+        bump_version(db_name, conn)
+    invalidate(db_name)
+    return WriteResult(rows = len(df), elapsed = time.perf_counter() - started)
 
-@st.experimental_memo(ttl=600)
 def insert_data(df, db_name):
-    db_connection = _connect_db()
-    df.to_sql(name= db_name, con=db_connection, if_exists='append',index=False)
+    return upsert_data(df, db_name)
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Maintenance of the tables written by upsert_data')
+    parser.add_argument('--dedupe', nargs = '+', default = [], metavar = 'TABLE',
+        help = 'keep the last row of each natural key (see UPSERT_KEYS) and add the UNIQUE index upsert_data relies on')
+    args = parser.parse_args()
+    for db_name in args.dedupe:
+        print(f'{db_name}: {dedupe_table(db_name)} duplicate rows removed')
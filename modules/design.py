@@ -1,7 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from modules import profiling
+from modules.downsample import downsample, CHART_WIDTH
+from modules.shared import process_singleton
+
+PLOTLY_TEMPLATE = 'simple_white'
 
 colors = ["#fd7f6f", "#7eb0d5", "#b2e061", "#bd7ebe", "#ffb55a", "#ffee65", "#beb9db", "#fdcce5", "#8bd3c7"] + ["#ea5545", "#f46a9b", "#ef9b20", "#edbf33", "#ede15b", "#bdcf32", "#87bc45", "#27aeef", "#b33dc6"]
  # Spring Pastel + Retro Metro
@@ -9,12 +15,22 @@ colors = ["#fd7f6f", "#7eb0d5", "#b2e061", "#bd7ebe", "#ffb55a", "#ffee65", "#be
 all_business = ['WSA와인아카데미', 'Wine Folly', 'after9', 'winebook_official', '나라셀라 • NARA CELLAR', '와인21 @wine21.com', '와인비전 Winevision', '주류학개론', '퍼플독ㅣPurpleDog', '달리 Dali 주류 스마트오더', '루얼 잠실새내 와인샵&테이스팅룸', '와인소셜', '와프너 | wapener', '테이스팅 와인샵 와인도어', '와인인_WINEIN.(Wine inspiration)']
 
 business_colormap = dict(zip(all_business, colors[:len(all_business)-1]))
-    
 
+@lru_cache(maxsize = None)
+def _plotly():
+    """Imports plotly on the first chart rather than at page start, and sets the default template."""
+    import plotly.express as px
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    pio.templates.default = PLOTLY_TEMPLATE
+    return px, go
+
+@profiling.profiled('Bar')
 def Bar(df:pd.DataFrame, x:str, y:str, group:str, text = None, title:str = '', colormap = None, range_slider:bool = False, barmode = 'relative', facet_col = None):
+    px, _ = _plotly()
     texttemplate = "%{text}"
     if text:
-        if df[text].dtype == float:
+        if pd.api.types.is_float_dtype(df[text]):
             texttemplate = "%{text:.2f}"
         if '수' in text:
             texttemplate = "%{text:.0f}"
@@ -64,3 +80,84 @@ def Bar(df:pd.DataFrame, x:str, y:str, group:str, text = None, title:str = '', c
     
     
     return fig
+
+
+class FigureCache():
+    """LRU cache of built figures, shared by every session of the process."""
+    def __init__(self, max_entries:int = 64):
+        self.max_entries = max_entries
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                return self._figures[key]
+        fig = build()
+        with self._lock:
+            self._figures[key] = fig
+            while len(self._figures) > self.max_entries:
+                self._figures.popitem(last = False)
+        return fig
+
+@process_singleton
+def _figure_cache():
+    return FigureCache()
+
+@profiling.cache_miss
+def _build_trend_figure(source:pd.DataFrame, feature:str, accounts:list, date_range:tuple, period:int, plot_type:list, colormap:dict, width:int):
+    date_start, date_end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
+    source = source.loc[source['이름'].isin(accounts) & source['날짜'].between(date_start, date_end), ['이름', '날짜', feature]]
+    plot_title = f'{feature}'
+    if '증감' in feature:
+        source = source.dropna(subset = [feature])
+        plot_title += f'({period}일 전 대비)'
+    source, rule = downsample(source, '날짜', '이름', feature, width)
+    if rule is not None:
+        plot_title += {'W': ' - 주별', 'MS': ' - 월별'}[rule]
+    texttemplate = '%{y}' if pd.api.types.is_integer_dtype(source[feature]) else '%{y:.2f}'
+
+    dates = source['날짜'].to_numpy()
+    values = source[feature].to_numpy()
+    groups = source.groupby('이름', sort = False, observed = True).indices
+    _, go = _plotly()
+    fig = go.Figure()
+    for chart in ['라인', '바']:
+        if chart not in plot_type:
+            continue
+        for i, (name, idx) in enumerate(groups.items()):
+            color = colormap.get(name, colors[i % len(colors)])
+            hovertemplate = f'이름={name}<br>날짜=%{{x}}<br>{feature}=%{{y}}<extra></extra>'
+            if chart == '라인':
+                fig.add_trace(go.Scatter(x = dates[idx], y = values[idx], name = name, legendgroup = name, mode = 'lines+markers', line_color = color, hovertemplate = hovertemplate))
+            else:
+                fig.add_trace(go.Bar(x = dates[idx], y = values[idx], name = name, legendgroup = name, marker_color = color, opacity = 0.5, texttemplate = texttemplate, hovertemplate = hovertemplate))
+    fig.update_layout(title = plot_title, xaxis_title= "날짜", yaxis_title= feature,)
+    fig.update_xaxes(rangeslider_visible=True)
+    return fig
+
+@profiling.profiled('trend_figure', cached = True)
+def trend_figure(source:pd.DataFrame, feature:str, accounts:list, date_range:tuple, period:int, plot_type:list, version = None, colormap:dict = business_colormap, width:int = CHART_WIDTH):
+    """Line/bar trend of `feature` for `accounts`, memoized on the chart inputs.
+
+    Traces are built straight from the column arrays, one per account and chart type.
+    Long ranges are downsampled to what `width` pixels can show (see modules.downsample),
+    so the payload stays bounded as the history grows.
+
+    Args:
+        source (pd.DataFrame): Translated summary with 이름, 날짜 and `feature`
+        feature (str): Column to plot
+        accounts (list): Accounts to plot
+        date_range (tuple): (start, end) dates, inclusive
+        period (int): Period of the 증감 columns, shown in the title
+        plot_type (list): '라인' and/or '바'
+        version (optional): Anything that changes when the data does, e.g. table_version('daily_summary').
+            The latest date is not enough: same-day rewrites and late rows leave it as is.
+        width (int, optional): Chart width in pixels
+
+    Returns:
+        go.Figure: The figure
+    """
+    key = (feature, tuple(accounts), tuple(str(d) for d in date_range), period, tuple(plot_type), str(version), width)
+    return _figure_cache().get_or_build(key, lambda: _build_trend_figure(source, feature, accounts, date_range, period, plot_type, colormap, width))
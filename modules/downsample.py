@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+CHART_WIDTH = 1200  # px, the width trend charts are laid out for when the real one is unknown
+PX_PER_POINT = 3  # at most one point per this many pixels, per trace
+AGGREGATE_FACTOR = 4  # beyond this many times the point budget, daily points are aggregated instead of sampled
+
+def lttb(x:np.ndarray, y:np.ndarray, n_out:int):
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points of (x, y) that keep the shape of the line.
+
+    The first and last points are always kept. Each bucket in between keeps the point forming
+    the largest triangle with the point kept in the previous bucket and the mean of the next one.
+
+    Args:
+        x (np.ndarray): Increasing x values (numeric)
+        y (np.ndarray): y values
+        n_out (int): Number of points to keep, at least 3
+
+    Returns:
+        np.ndarray: Sorted indices of the kept points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept = np.empty(n_out, dtype = int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+def resample_rule(n_days:int, max_points:int):
+    """None, 'W' or 'MS': the aggregation keeping `n_days` daily points near `max_points`."""
+    if n_days <= AGGREGATE_FACTOR * max_points:
+        return None
+    if n_days / 7 <= AGGREGATE_FACTOR * max_points:
+        return 'W'
+    return 'MS'
+
+def downsample(df:pd.DataFrame, date_col:str, name_col:str, value_col:str, width:int = CHART_WIDTH):
+    """Reduces the points of each account in `df` to what a chart `width` pixels wide can show.
+
+    Up to width / PX_PER_POINT points per account are sent as is. A few times more are
+    thinned out with LTTB, keeping the real daily points that shape the line. Longer
+    ranges are aggregated per week or month: the mean for 증감 columns, the last value of
+    the period for levels such as 팔로워 수.
+
+    Returns:
+        tuple: (the reduced frame sorted by account and date, the rule used: None, 'W' or 'MS')
+    """
+    max_points = max(width // PX_PER_POINT, 3)
+    n_days = df[date_col].nunique()
+    rule = resample_rule(n_days, max_points)
+    df = df.sort_values([name_col, date_col])
+    if rule is not None:
+        how = 'mean' if '증감' in value_col else 'last'
+        df = (df.set_index(date_col).groupby(name_col, sort = False, observed = True)[value_col]
+            .resample(rule).agg(how).dropna().reset_index())
+    sizes = df.groupby(name_col, observed = True).size()
+    if sizes.empty or sizes.max() <= max_points:
+        return df.reset_index(drop = True), rule
+    dates = df[date_col].to_numpy().astype('datetime64[ns]').astype(np.int64)
+    values = df[value_col].to_numpy()
+    keep = []
+    for idx in df.groupby(name_col, sort = False, observed = True).indices.values():
+        keep.append(idx[lttb(dates[idx], values[idx], max_points)])
+    return df.iloc[np.concatenate(keep)].reset_index(drop = True), rule
@@ -0,0 +1,83 @@
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import pandas as pd
+from modules.weekly import week_key
+
+EXPORT_DIR = '.cache/exports'
+CSV_CHUNK_ROWS = 5000
+# label: (extension, mime type)
+FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+_locks = dict()
+_locks_lock = threading.Lock()
+
+def available_formats():
+    """Labels of FORMATS whose writer is installed. Excel needs openpyxl, which is optional."""
+    return [label for label, (ext, _) in FORMATS.items() if ext != 'xlsx' or importlib.util.find_spec('openpyxl') is not None]
+
+def iter_csv(df:pd.DataFrame, chunk_rows:int = CSV_CHUNK_ROWS):
+    """UTF-8 CSV of `df` in `chunk_rows` row pieces, the header with the first one.
+
+    Same bytes as df.to_csv().encode('utf-8'), without holding the whole file in memory.
+    """
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(header = start == 0).encode('utf-8')
+
+def _write(df:pd.DataFrame, path:str, ext:str):
+    if ext == 'csv':
+        with open(path, 'wb') as f:
+            for chunk in iter_csv(df):
+                f.write(chunk)
+    elif ext == 'parquet':
+        df.to_parquet(path, index = False)
+    elif ext == 'xlsx':
+        df.to_excel(path, index = False, engine = 'openpyxl')
+    else:
+        raise ValueError(f'Unknown export format: {ext}')
+
+def export_path(table:str, week, columns:iter, fmt:str = 'CSV', root:str = EXPORT_DIR):
+    """Where the export of `columns` of `table` for the week ending on `week` is kept."""
+    ext = FORMATS[fmt][0]
+    digest = hashlib.sha1(repr(tuple(columns)).encode('utf-8')).hexdigest()[:12]
+    return os.path.join(root, f'{table}-{week_key(week):%Y%m%d}-{digest}.{ext}')
+
+def export_file(table:str, week, columns:iter, load, fmt:str = 'CSV', version = None, root:str = EXPORT_DIR):
+    """Path of the export file, written from `load()` only when it is missing or stale.
+
+    Files are keyed by (table, week, columns, format), never by hashing the data. A JSON
+    sidecar keeps the `version` (e.g. the db data-version token) the file was written at,
+    and a different version rewrites it.
+
+    Args:
+        table (str): Name of the exported table
+        week: Last day of the report week
+        columns (iter): Exported columns, in order
+        load (callable): Returns the frame to export. Only called when the file is (re)built.
+        fmt (str, optional): One of FORMATS
+        version (optional): JSON-serializable freshness token
+
+    Returns:
+        str: Path of the file
+    """
+    path = export_path(table, week, columns, fmt, root)
+    meta_path = path + '.json'
+    with _locks_lock:
+        lock = _locks.setdefault(path, threading.Lock())
+    with lock:
+        if os.path.exists(path) and os.path.exists(meta_path):
+            with open(meta_path, encoding = 'utf-8') as f:
+                if json.load(f)['version'] == version:
+                    return path
+        os.makedirs(root, exist_ok = True)
+        df = load()[list(columns)]
+        _write(df, path + '.tmp', FORMATS[fmt][0])
+        os.replace(path + '.tmp', path)
+        with open(meta_path, 'w', encoding = 'utf-8') as f:
+            json.dump({'version': version, 'rows': len(df)}, f)
+    return path
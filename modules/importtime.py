@@ -0,0 +1,71 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Imported by every page before anything else, measured first and not counted against the budget
+BASELINE = ('streamlit', 'pandas')
+# Dependencies that must not load before a tab actually needs them
+HEAVY_MODULES = ('plotly.express', 'st_aggrid', 'sqlalchemy', 'pymysql')
+# Milliseconds each group of imports may add on top of BASELINE
+IMPORT_BUDGET_MS = {
+    'main.py': 60,
+    'pages/reports.py': 60,
+    'modules.design': 20,
+    'modules.tools': 20,
+}
+# What each page imports at the top, i.e. before check_password() shows the login screen
+PAGE_IMPORTS = {
+    'main.py': ('modules.cube', 'modules.text', 'modules.design', 'modules.tools', 'modules.auth', 'modules.profiling'),
+    'pages/reports.py': ('modules.text', 'modules.dates', 'modules.tools', 'modules.design', 'modules.weekly', 'modules.auth', 'modules.profiling'),
+}
+_MARK = '-- baseline imported --'
+
+def _script(modules:iter):
+    lines = [f'import {m}' for m in BASELINE]
+    lines.append(f'import sys; before = set(sys.modules); print({_MARK!r}, file = sys.stderr)')
+    lines += [f'import {m}' for m in modules]
+    lines.append(f'heavy = {HEAVY_MODULES!r}')
+    lines.append('loaded = set(sys.modules) - before')
+    lines.append('import json; print(json.dumps(sorted(h for h in heavy if any(m == h or m.startswith(h + ".") for m in loaded))))')
+    return '\n'.join(lines)
+
+def measure(modules:iter):
+    """Import time of `modules` in a fresh interpreter on top of BASELINE, from `python -X importtime`.
+
+    Returns:
+        dict: {'ms': milliseconds, 'heavy': HEAVY_MODULES newly loaded, 'top': slowest top-level imports}
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', _script(modules)], capture_output = True, text = True, check = True)
+    lines = proc.stderr.splitlines()
+    lines = lines[lines.index(_MARK) + 1:]
+    top = dict()
+    for line in lines:
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not name.startswith('  '):
+            # no nesting indent after the bar: a top-level import
+            top[name.strip()] = int(cumulative) / 1000
+    return {
+        'ms': round(sum(top.values()), 1),
+        'heavy': json.loads(proc.stdout.strip().splitlines()[-1]),
+        'top': dict(sorted(top.items(), key = lambda item: -item[1])[:5]),
+    }
+
+def run(budget:dict = IMPORT_BUDGET_MS):
+    """Measures every group of IMPORT_BUDGET_MS and flags those over budget or loading heavy modules."""
+    report = dict()
+    for group, limit in budget.items():
+        result = measure(PAGE_IMPORTS.get(group, (group,)))
+        result['budget_ms'] = limit
+        result['ok'] = result['ms'] <= limit and not result['heavy']
+        report[group] = result
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Check the import-time budget of the pages before the login screen')
+    parser.parse_args()
+    report = run()
+    print(json.dumps(report, indent = 2, ensure_ascii = False))
+    sys.exit(0 if all(r['ok'] for r in report.values()) else 1)
@@ -0,0 +1,2 @@
+from modules.ingest.graph import GraphClient, GraphAPIError, RateLimiter
+from modules.ingest.pipeline import ingest, IngestResult
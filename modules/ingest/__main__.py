@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import os
+from modules.ingest.graph import GRAPH_URL
+from modules.ingest.pipeline import ingest
+
+parser = argparse.ArgumentParser(description = 'Fetch the tracked Instagram accounts into daily_summary and latest_media')
+parser.add_argument('--usernames', nargs = '+', default = [u for u in os.environ.get('IG_USERNAMES', '').split(',') if u],
+    help = 'Instagram usernames of the tracked accounts (default: comma separated IG_USERNAMES)')
+parser.add_argument('--base-url', default = GRAPH_URL)
+parser.add_argument('--batch-size', type = int, default = 500)
+parser.add_argument('--rate', type = float, default = 20, help = 'requests per second')
+parser.add_argument('--concurrency', type = int, default = 10)
+args = parser.parse_args()
+
+# The scheduled job has no secrets.toml: point modules.db at the MySQL database its USER/PW/HOST/DB_NAME variables describe
+if not os.environ.get('DB_URL') and all(os.environ.get(k) for k in ('USER', 'PW', 'HOST', 'DB_NAME')):
+    from sqlalchemy.engine import URL
+    os.environ['DB_URL'] = URL.create('mysql+pymysql', username = os.environ['USER'], password = os.environ['PW'],
+        host = os.environ['HOST'], database = os.environ['DB_NAME']).render_as_string(hide_password = False)
+
+result = asyncio.run(ingest(
+    args.usernames, os.environ['ACCESS_KEY'], os.environ['INSTAGRAM_ACCOUNT_ID'],
+    base_url = args.base_url, batch_size = args.batch_size, rate = args.rate, concurrency = args.concurrency,
+))
+for table, n_rows in result.written.items():
+    print(f'{table}: {n_rows} rows')
+for username, error in result.failed.items():
+    print(f'{username} failed: {error!r}')
+if result.failed:
+    raise SystemExit(1)
@@ -0,0 +1,106 @@
+import asyncio
+import random
+from urllib.parse import urlsplit
+import aiohttp
+
+GRAPH_URL = 'https://graph.facebook.com/v15.0'
+PROFILE_FIELDS = ['id', 'username', 'name', 'biography', 'website', 'profile_picture_url', 'followers_count', 'follows_count', 'media_count']
+MEDIA_FIELDS = ['id', 'caption', 'media_type', 'media_url', 'permalink', 'timestamp', 'like_count', 'comments_count']
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Graph API error codes for application, user and page level throttling
+RATE_LIMIT_CODES = {4, 17, 32, 613}
+
+class GraphAPIError(Exception):
+    def __init__(self, status:int, error:dict):
+        self.status = status
+        self.error = error
+        super().__init__(f"{status}: {error.get('message', error)}")
+
+class RateLimiter():
+    """Spaces requests to at most `rate` per second with at most `concurrency` in flight."""
+    def __init__(self, rate:float, concurrency:int):
+        self._interval = 1 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        await self._semaphore.acquire()
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._semaphore.release()
+
+class GraphClient():
+    """Instagram Graph API client with per-host rate limiting and retries with jittered exponential backoff.
+
+    Args:
+        session (aiohttp.ClientSession): Session used for every request
+        access_token (str): Graph API access token
+        ig_user_id (str): Instagram business account id that runs business discovery
+        base_url (str, optional): API root, e.g. a local fake server in tests
+        rate (float, optional): Requests per second per host
+        concurrency (int, optional): Requests in flight per host
+        retries (int, optional): Retries of throttled, 5xx or failed requests
+        backoff (float, optional): Base delay in seconds of the first retry
+    """
+    def __init__(self, session:aiohttp.ClientSession, access_token:str, ig_user_id:str, base_url:str = GRAPH_URL, rate:float = 20, concurrency:int = 10, retries:int = 4, backoff:float = 0.5):
+        self.session = session
+        self.access_token = access_token
+        self.ig_user_id = ig_user_id
+        self.base_url = base_url.rstrip('/')
+        self.rate = rate
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._limiters = dict()
+
+    def _limiter(self, url:str):
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = RateLimiter(self.rate, self.concurrency)
+        return self._limiters[host]
+
+    async def get(self, path:str, params:dict):
+        url = f'{self.base_url}/{path}'
+        params = {**params, 'access_token': self.access_token}
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._limiter(url):
+                    async with self.session.get(url, params = params) as resp:
+                        payload = await resp.json(content_type = None)
+                if resp.status == 200:
+                    return payload
+                error = payload.get('error', {}) if isinstance(payload, dict) else {}
+                if attempt == self.retries or not (resp.status in RETRY_STATUS or error.get('code') in RATE_LIMIT_CODES):
+                    raise GraphAPIError(resp.status, error)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+
+    async def business(self, username:str):
+        """Profile fields and counts of `username` via business discovery."""
+        fields = f"business_discovery.username({username}){{{','.join(PROFILE_FIELDS)}}}"
+        payload = await self.get(self.ig_user_id, {'fields': fields})
+        return payload['business_discovery']
+
+    async def media_pages(self, username:str, page_size:int = 50):
+        """Yields the posts of `username` one page at a time, following the `after` cursors."""
+        after = None
+        while True:
+            edge = f'media.limit({page_size})' + (f'.after({after})' if after else '')
+            fields = f"business_discovery.username({username}){{{edge}{{{','.join(MEDIA_FIELDS)}}}}}"
+            payload = await self.get(self.ig_user_id, {'fields': fields})
+            media = payload['business_discovery'].get('media', {})
+            yield media.get('data', [])
+            paging = media.get('paging', {})
+            after = paging.get('cursors', {}).get('after')
+            if not (after and paging.get('next')):
+                break
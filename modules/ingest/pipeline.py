@@ -0,0 +1,121 @@
+import asyncio
+from collections import defaultdict, namedtuple
+from datetime import datetime
+import aiohttp
+import pandas as pd
+from modules.dates import KST
+from modules.ingest.graph import GraphClient, GRAPH_URL
+
+IngestResult = namedtuple('IngestResult', ['written', 'failed'])
+
+def summary_row(profile:dict, like_count:int, comments_count:int, date):
+    """daily_summary row of one account; like/comments counts are totals over its posts."""
+    return {
+        'name': profile.get('name') or profile.get('username'),
+        'date': date,
+        'followers_count': profile.get('followers_count'),
+        'follows_count': profile.get('follows_count'),
+        'media_count': profile.get('media_count'),
+        'like_count': like_count,
+        'comments_count': comments_count,
+        'biography': profile.get('biography'),
+        'website': profile.get('website'),
+        'profile_picture_url': profile.get('profile_picture_url'),
+    }
+
+def kst_timestamp(value):
+    """Graph API timestamp (e.g. '2022-10-01T10:00:00+0000') as the naive KST datetime the tables keep."""
+    if value is None:
+        return None
+    return pd.to_datetime(value, utc = True).tz_convert('Asia/Seoul').tz_localize(None)
+
+def media_row(profile:dict, media:dict, date):
+    return {
+        'name': profile.get('name') or profile.get('username'),
+        'timestamp': kst_timestamp(media.get('timestamp')),
+        'date': date,
+        'media_type': media.get('media_type'),
+        'media_url': media.get('media_url'),
+        'permalink': media.get('permalink'),
+        'like_count': media.get('like_count', 0),
+        'comments_count': media.get('comments_count', 0),
+        'caption': media.get('caption'),
+    }
+
+async def ingest_account(client:GraphClient, username:str, date, queue:asyncio.Queue):
+    """Fetches one account and its media, putting rows on `queue` as each page arrives."""
+    profile = await client.business(username)
+    like_count = comments_count = 0
+    async for page in client.media_pages(username):
+        rows = [media_row(profile, media, date) for media in page]
+        like_count += sum(row['like_count'] for row in rows)
+        comments_count += sum(row['comments_count'] for row in rows)
+        await queue.put(('latest_media', rows))
+    await queue.put(('daily_summary', [summary_row(profile, like_count, comments_count, date)]))
+
+async def _write_batches(queue:asyncio.Queue, write, batch_size:int):
+    """Accumulates rows per table and writes them in batches of `batch_size` off the event loop."""
+    buffers = defaultdict(list)
+    written = defaultdict(int)
+
+    async def flush(table):
+        rows, buffers[table] = buffers[table], []
+        if rows:
+            await asyncio.to_thread(write, pd.DataFrame(rows), table)
+            written[table] += len(rows)
+
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        table, rows = item
+        buffers[table].extend(rows)
+        if len(buffers[table]) >= batch_size:
+            await flush(table)
+    for table in list(buffers):
+        await flush(table)
+    return dict(written)
+
+async def ingest(usernames:list, access_token:str, ig_user_id:str, write = None, base_url:str = GRAPH_URL, date = None, batch_size:int = 500, rate:float = 20, concurrency:int = 10, retries:int = 4, backoff:float = 0.5):
+    """Fetches every account in `usernames` concurrently and streams the rows into batched writes.
+
+    Args:
+        usernames (list): Instagram usernames to fetch
+        access_token (str): Graph API access token
+        ig_user_id (str): Instagram business account id that runs business discovery
+        write (callable, optional): write(df, table). Defaults to modules.db.upsert_data.
+        base_url (str, optional): API root
+        date (optional): Collection date of the rows. Today in KST by default.
+        batch_size (int, optional): Rows per write
+        rate, concurrency, retries, backoff (optional): See GraphClient
+
+    Returns:
+        IngestResult: Rows written per table and {username: exception} of the failed accounts
+
+    Raises:
+        Exception: Whatever `write` raised. The remaining fetches are cancelled.
+    """
+    if write is None:
+        from modules.db import upsert_data as write
+    if date is None:
+        date = pd.Timestamp(datetime.now(tz = KST)).tz_localize(None).normalize()
+    queue = asyncio.Queue(maxsize = 4 * max(len(usernames), 1))
+    async with aiohttp.ClientSession(timeout = aiohttp.ClientTimeout(total = 60)) as session:
+        client = GraphClient(session, access_token, ig_user_id, base_url, rate, concurrency, retries, backoff)
+        writer = asyncio.create_task(_write_batches(queue, write, batch_size))
+        producers = asyncio.gather(*[ingest_account(client, u, date, queue) for u in usernames], return_exceptions = True)
+
+        async def finish():
+            results = await producers
+            await queue.put(None)
+            return results
+        finisher = asyncio.create_task(finish())
+        await asyncio.wait([writer, finisher], return_when = asyncio.FIRST_EXCEPTION)
+        if not finisher.done():
+            # The writer failed: nothing drains the queue anymore, so stop the producers blocked on it
+            finisher.cancel()
+            await asyncio.gather(finisher, return_exceptions = True)
+        written = writer.result()
+        results = finisher.result()
+    failed = {u: r for u, r in zip(usernames, results) if isinstance(r, Exception)}
+    return IngestResult(written = written, failed = failed)
@@ -0,0 +1,134 @@
+import heapq
+from itertools import islice
+import numpy as np
+import pandas as pd
+from modules.db import load_window, table_version, MEDIA_COLUMNS
+from modules.shared import shared_store, view
+from modules.weekly import week_key
+
+SORT_KEYS = ('date',)
+TOP_KEYS = ('engagement', 'like_count', 'comments_count')
+
+def week_end(timestamps:pd.Series):
+    """Last day of the report week of each post: the Monday after the day it was uploaded (KST wall clock)."""
+    timestamps = pd.to_datetime(timestamps)
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert('Asia/Seoul').dt.tz_localize(None)
+    days = timestamps.dt.normalize()
+    return days - pd.to_timedelta(days.dt.dayofweek, unit = 'D') + pd.Timedelta(days = 7)
+
+class TopKIndex():
+    """Posts ranked per (account, week) bucket for each of TOP_KEYS, best first.
+
+    A query over any set of accounts and range of weeks merges the already sorted buckets
+    with a heap and stops after the requested rows, so the best posts of a quarter over every
+    account cost a few heap pops per bucket instead of a sort of all the posts.
+
+    Engagement rate is engagement / followers, and followers are constant within a bucket, so
+    buckets are ranked by engagement and scaled by the followers given at query time.
+    Ties keep the order of the rows in `media`, as a stable sort would, and posts without a
+    value (NaN counts) come last in their bucket.
+    """
+    def __init__(self, media:pd.DataFrame, sort_keys:iter = TOP_KEYS):
+        self.media = media
+        self.sort_keys = tuple(sort_keys)
+        weeks = week_end(media['timestamp']).rename('week')
+        groups = media.groupby([media['name'], weeks], sort = True, observed = True, dropna = False).indices
+        self._weeks = dict()
+        for name, week in groups:
+            self._weeks.setdefault(name, []).append(week)
+        self._buckets = dict()
+        for key in self.sort_keys:
+            if key == 'engagement' and key not in media:
+                values = (media['like_count'] + media['comments_count']).to_numpy(dtype = float)
+            else:
+                values = media[key].to_numpy(dtype = float)
+            for bucket, idx in groups.items():
+                order = np.lexsort((idx, -values[idx], np.isnan(values[idx])))
+                self._buckets[(key, *bucket)] = (values[idx][order], idx[order])
+
+    def buckets(self, names:iter = None, start = None, end = None):
+        """(account, week) of the buckets of `names` (all accounts by default) with weeks in [start, end]."""
+        start = None if start is None else week_key(start)
+        end = None if end is None else week_key(end)
+        for name in (self._weeks if names is None else names):
+            for week in self._weeks.get(name, ()):
+                if (start is None or week >= start) and (end is None or week <= end):
+                    yield name, week
+
+    def top(self, k:int = 3, sort_key:str = 'engagement', names:iter = None, start = None, end = None, followers:pd.Series = None, offset:int = 0):
+        """The posts ranked [offset, offset + k) by `sort_key` within the selected buckets.
+
+        Args:
+            k (int, optional): Number of posts
+            sort_key (str, optional): One of the index's sort keys
+            names (iter, optional): Accounts. All of them by default.
+            start, end (optional): First and last report week (inclusive). Unbounded by default.
+            followers (pd.Series, optional): Followers by account, or by (week, account) over several
+                weeks. When given, posts are ranked by 100 * value / followers, returned as
+                `engagementRate`, and accounts without followers are left out.
+            offset (int, optional): Number of best posts to skip
+
+        Returns:
+            pd.DataFrame: The rows of `media`, best first
+        """
+        streams = []
+        for name, week in self.buckets(names, start, end):
+            values, positions = self._buckets[(sort_key, name, week)]
+            if followers is not None:
+                n_followers = followers.get((week, name)) if isinstance(followers.index, pd.MultiIndex) else followers.get(name)
+                if n_followers is None or not n_followers > 0:
+                    continue
+                values = 100 * values / n_followers
+            # NaN would break the heap's comparisons: ranked after every value instead
+            scores = np.where(np.isnan(values), np.inf, -values)
+            streams.append(zip(scores.tolist(), positions.tolist()))
+        best = list(islice(heapq.merge(*streams), offset, offset + k))
+        rows = self.media.iloc[[position for _, position in best]].reset_index(drop = True)
+        if followers is not None:
+            rows['engagementRate'] = [np.nan if score == np.inf else -score for score, _ in best]
+        return rows
+
+class MediaIndex():
+    """Media posts with their row order pre-sorted per account, newest first.
+
+    Each order is computed once, so a page is a slice of positions and only the
+    visible rows are materialized. Pages by like or comment count come from the
+    TopKIndex of the same posts (`self.top`).
+    """
+    def __init__(self, media:pd.DataFrame, sort_keys:iter = SORT_KEYS):
+        self.media = media.reset_index(drop = True)
+        self.top = TopKIndex(self.media)
+        self._order = dict()
+        for key in sort_keys:
+            ordered = self.media.sort_values(key, ascending = False, kind = 'mergesort')
+            positions = ordered.index.to_numpy()
+            for name, idx in ordered.groupby('name', sort = False, observed = True).indices.items():
+                self._order[(name, key)] = positions[idx]
+
+    def count(self, name:str):
+        order = self._order.get((name, SORT_KEYS[0]))
+        return 0 if order is None else len(order)
+
+    def page(self, name:str, sort_key:str = 'date', offset:int = 0, limit:int = 6):
+        """Posts of `name` at [offset, offset + limit) in descending `sort_key` order."""
+        if (name, sort_key) not in self._order and sort_key in self.top.sort_keys:
+            return self.top.top(limit, sort_key, names = [name], offset = offset)
+        order = self._order.get((name, sort_key))
+        if order is None:
+            return self.media.iloc[0:0]
+        return self.media.iloc[order[offset:offset + limit]].reset_index(drop = True)
+
+def load_media_index():
+    """Returns the process-wide MediaIndex of latest_media, rebuilt when the table's data version changes."""
+    return shared_store().get(('media_index', 'latest_media'), lambda: MediaIndex(load_window('latest_media', columns = MEDIA_COLUMNS)), version = table_version('latest_media'))
+
+def load_top_index(media:pd.DataFrame, db_name:str, key:tuple = ()):
+    """TopKIndex of `media`, a frame read from `db_name`, shared per process and data version of that table.
+
+    Args:
+        media (pd.DataFrame): The frame the page shows
+        db_name (str): Table it was read from
+        key (tuple, optional): What else identifies the frame, e.g. the bounds of its window
+    """
+    return shared_store().get(('top_index', db_name) + tuple(key), lambda: TopKIndex(view(media)), version = table_version(db_name))
@@ -0,0 +1,158 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+
+# Profiling is off unless this variable is set (e.g. WBA9_PROFILE=1 streamlit run main.py).
+# When off, the decorators return the functions unchanged and span() is a shared no-op.
+PROFILE_ENV = 'WBA9_PROFILE'
+PROFILE_LOG_ENV = 'WBA9_PROFILE_LOG'
+PROFILE_LOG = 'logs/profile.jsonl'
+# Past this size the log is moved to `<path>.1` (replacing the previous one) and a new one is started
+PROFILE_LOG_MAX_BYTES = 10 * 1024 ** 2
+ENABLED = os.environ.get(PROFILE_ENV, '') not in ('', '0')
+
+_NULL_SPAN = nullcontext()
+_local = threading.local()  # records of the rerun running on this script thread
+_log_lock = threading.Lock()
+
+def _state():
+    if not hasattr(_local, 'stack'):
+        _local.records = None  # only collected inside rerun()
+        _local.stack = []
+    return _local
+
+def _rows(result):
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, (list, tuple)) and result and all(isinstance(r, pd.DataFrame) for r in result):
+        return sum(len(r) for r in result)
+    if isinstance(getattr(result, 'rows', None), int):
+        return result.rows
+    return None
+
+@contextmanager
+def _span(name:str, rows:int = None, cached:bool = False):
+    state = _state()
+    record = {'name': name, 'depth': len(state.stack), 'rows': rows, 'cache': None}
+    state.stack.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        state.stack.pop()
+        if cached and record['cache'] is None:
+            record['cache'] = 'hit'
+        if state.records is not None:
+            state.records.append(record)
+
+def span(name:str, rows:int = None):
+    """Times the block as one record of the current rerun. A no-op when profiling is off."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _span(name, rows)
+
+def profiled(name:str = None, cached:bool = False):
+    """Decorator recording wall time and result rows of each call.
+
+    With `cached`, the call counts as a cache hit unless a function wrapped in cache_miss
+    (the body under the cache decorator) ran during it.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(label, cached = cached) as record:
+                result = func(*args, **kwargs)
+                if record['rows'] is None:
+                    record['rows'] = _rows(result)
+                return result
+        return wrapper
+    return decorator
+
+def mark(cache:str):
+    """Sets 'hit' or 'miss' on the innermost running record."""
+    if not ENABLED:
+        return
+    stack = _state().stack
+    if stack:
+        stack[-1]['cache'] = cache
+
+def cache_miss(func):
+    """Marks the enclosing profiled call as a miss whenever `func` actually runs."""
+    if not ENABLED:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        mark('miss')
+        return func(*args, **kwargs)
+    return wrapper
+
+def _log_path():
+    return os.environ.get(PROFILE_LOG_ENV, PROFILE_LOG)
+
+def export(records:list, page:str, path:str = None, max_bytes:int = PROFILE_LOG_MAX_BYTES):
+    """Appends the records of one rerun to the JSON-lines log, rotating it once it exceeds `max_bytes`."""
+    path = path or _log_path()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+    line = json.dumps({'time': time.time(), 'page': page, 'records': records}, ensure_ascii = False)
+    with _log_lock:
+        if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+            os.replace(path, path + '.1')
+        with open(path, 'a', encoding = 'utf-8') as f:
+            f.write(line + '\n')
+
+@contextmanager
+def rerun(page:str):
+    """Collects the records of one script run of `page`, keeps them for profile_panel and logs them."""
+    if not ENABLED:
+        yield
+        return
+    import streamlit as st
+
+    state = _state()
+    state.records, state.stack = [], []
+    try:
+        with _span(page):
+            yield
+    finally:
+        records, state.records = state.records, None
+        st.session_state['profile_records'] = records
+        export(records, page)
+
+def summarize_records(records:list):
+    """Per-name calls, total seconds, rows and cache hits/misses, slowest first."""
+    if not records:
+        return pd.DataFrame(columns = ['name', 'calls', 'seconds', 'rows', 'hits', 'misses'])
+    df = pd.DataFrame(records)
+    df = df.assign(hits = df['cache'].eq('hit'), misses = df['cache'].eq('miss'))
+    summary = df.groupby('name', sort = False).agg(calls = ('name', 'size'), seconds = ('seconds', 'sum'), rows = ('rows', 'sum'), hits = ('hits', 'sum'), misses = ('misses', 'sum'))
+    return summary.sort_values('seconds', ascending = False).reset_index()
+
+def profile_panel():
+    """Sidebar table of the records of the last completed rerun. Shown only to admins (see modules.auth) when profiling is on."""
+    if not ENABLED:
+        return
+    import streamlit as st
+    from modules.auth import is_admin
+
+    if not is_admin():
+        return
+
+    records = st.session_state.get('profile_records')
+    with st.sidebar.expander('⏱️ 실행 시간'):
+        if not records:
+            st.caption('기록 없음')
+            return
+        st.dataframe(summarize_records(records).style.format({'seconds': '{:.3f}'}))
+        st.caption(f'로그: {_log_path()}')
+        from modules.db import cache_stats
+        st.json(cache_stats(), expanded = False)
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import shutil
+import pandas as pd
+from modules.cube import load_summary_cube, CUBE_PATH
+from modules.dates import get_report_period, report_bounds
+from modules.db import load_data, table_version
+from modules.shared import freeze, shared_store, view
+from modules.text import translate
+from modules.weekly import WeeklySummary, week_key
+
+REPORT_DIR = 'data/reports'
+HIGHLIGHT_COLUMNS = ['팔로워 증감(%)', '참여도 증감(%)', '게시물 증감(%)']
+SUMMARY_EXPORT_COLUMNS = ['순위', '이름', '날짜', '팔로우 수', '팔로워 수', '게시물 수',
+    '좋아요 수', '댓글 수', '참여도', '게시물 당 좋아요', '게시물 당 댓글', '팔로우 증감(수)', '팔로워 증감(수)', '게시물 증감(수)',
+    '좋아요 증감(수)', '댓글 증감(수)', '순위 증감(수)', '참여도 증감(수)', '게시물 당 좋아요 증감(수)',
+    '게시물 당 댓글 증감(수)', '팔로우 증감(%)', '팔로워 증감(%)', '게시물 증감(%)', '좋아요 증감(%)',
+    '댓글 증감(%)', '순위 증감(%)', '참여도 증감(%)', '게시물 당 좋아요 증감(%)',
+    '게시물 당 댓글 증감(%)']
+MEDIA_EXPORT_COLUMNS = ['이름', '게시물 주소', '게시물 종류', '좋아요 수', '댓글 수', '참여 수', '업로드 시간', '캡션']
+ALL_SCOPE = '전체'
+
+def report_dir(report_end, root:str = REPORT_DIR):
+    return os.path.join(root, f'{week_key(report_end):%Y%m%d}')
+
+def best_worst(weekly:WeeklySummary, report_date, column:str):
+    """Names of the accounts with the largest and smallest `column` in the week."""
+    return weekly.best(report_date, column)['이름'].values[0], weekly.worst(report_date, column)['이름'].values[0]
+
+def top_engagement_posts(week_summary:pd.DataFrame, week_media:pd.DataFrame, k:int = 3):
+    """Top-k posts by engagement rate for each account and for all accounts together.
+
+    The overall top-k is taken from the union of the per-account results, never from the full media frame.
+
+    Returns:
+        pd.DataFrame: Posts with `engagementRate` and a `scope` column (account name or '전체')
+    """
+    followers = week_summary.set_index('이름')['팔로워 수']
+    media = week_media.loc[week_media['name'].isin(followers.index)]
+    posts = media.assign(engagementRate = 100 * media['engagement'] / media['name'].astype(str).map(followers).astype(float))
+    best = posts.groupby('name', observed = True, sort = True)['engagementRate'].nlargest(k)
+    posts = posts.loc[best.index.get_level_values(-1)]
+    posts = posts.assign(scope = posts['name'].astype(str)).reset_index(drop = True)
+    overall = posts.nlargest(k, 'engagementRate').assign(scope = ALL_SCOPE)
+    return pd.concat([overall, posts], ignore_index = True)
+
+def indexed_top_posts(index, week_summary:pd.DataFrame, report_end, accounts:iter = None, k:int = 3):
+    """top_engagement_posts answered from a modules.media.TopKIndex instead of the week's media.
+
+    Only the week's buckets of the accounts in `week_summary` are merged, and only the
+    scopes shown are computed: '전체' and each of `accounts` (all of them by default).
+    """
+    followers = week_summary.set_index('이름')['팔로워 수']
+    accounts = followers.index if accounts is None else accounts
+    scopes = [(ALL_SCOPE, followers.index)] + [(account, [account]) for account in accounts]
+    return pd.concat([index.top(k, 'engagement', names, report_end, report_end, followers).assign(scope = scope) for scope, names in scopes], ignore_index = True)
+
+def build_week_artifacts(weekly:WeeklySummary, media:pd.DataFrame, report_end, root:str = REPORT_DIR):
+    """Writes the artifacts pages/reports.py shows for the week ending on `report_end`.
+
+    - summary.parquet: the week's summary rows
+    - media.parquet: posts uploaded in the week
+    - top3.parquet: top-3 posts by engagement rate per account and overall
+    - highlights.json: best and worst account for each of HIGHLIGHT_COLUMNS
+    """
+    report_start, report_end = report_bounds(report_end)
+    week_summary = weekly.week(report_end)
+    if week_summary.empty:
+        return None
+    timestamps = media['timestamp'].dt.tz_localize(None) if media['timestamp'].dt.tz is not None else media['timestamp']
+    week_media = media.loc[timestamps.between(week_key(report_start), week_key(report_end))]
+    week_media = week_media.assign(engagement = week_media['like_count'] + week_media['comments_count'])
+
+    path = report_dir(report_end, root)
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors = True)
+    os.makedirs(tmp_path)
+    week_summary.to_parquet(os.path.join(tmp_path, 'summary.parquet'), index = False)
+    week_media.to_parquet(os.path.join(tmp_path, 'media.parquet'), index = False)
+    top_engagement_posts(week_summary, week_media).to_parquet(os.path.join(tmp_path, 'top3.parquet'), index = False)
+    with open(os.path.join(tmp_path, 'highlights.json'), 'w', encoding = 'utf-8') as f:
+        json.dump({c: best_worst(weekly, report_end, c) for c in HIGHLIGHT_COLUMNS}, f, ensure_ascii = False)
+
+    shutil.rmtree(path, ignore_errors = True)
+    os.replace(tmp_path, path)
+    return path
+
+def _read_report_artifacts(path:str):
+    artifacts = {name: freeze(pd.read_parquet(os.path.join(path, f'{name}.parquet'))) for name in ['summary', 'media', 'top3']}
+    with open(os.path.join(path, 'highlights.json'), encoding = 'utf-8') as f:
+        artifacts['highlights'] = json.load(f)
+    return artifacts
+
+def load_report_artifacts(report_end, root:str = REPORT_DIR):
+    """Reads the artifacts of the week ending on `report_end`, or None when they were not built.
+
+    They are read once per process (again only when the batch rewrites them) and every
+    session gets views of the same frames.
+    """
+    path = report_dir(report_end, root)
+    if not os.path.isdir(path):
+        return None
+    artifacts = shared_store().get(('report', path), lambda: _read_report_artifacts(path), version = os.path.getmtime(path))
+    return {name: view(value) if isinstance(value, pd.DataFrame) else value for name, value in artifacts.items()}
+
+def weekly_summaries(df_daily:pd.DataFrame, cube_path:str = CUBE_PATH, version = None):
+    """Translated period-7 summaries of every Monday, as pages/reports.py stores them in weekly_summary.
+
+    Computed once per cube version and shared read-only by every session. `version` is the
+    data version of `df_daily`, see load_summary_cube.
+    """
+    cube = load_summary_cube(df_daily, path = cube_path, version = version)
+
+    def build():
+        df_weekly_summary = cube.slice(7)
+        df_weekly_summary.columns = translate(df_weekly_summary.columns)
+        return df_weekly_summary.loc[df_weekly_summary['날짜'].dt.dayofweek == 0]
+    return shared_store().get(('weekly_summaries', cube_path), build, version = cube.version)
+
+def run(report_ends = None, root:str = REPORT_DIR, force:bool = False):
+    """Builds the artifacts of every report week that has none yet (all of them with `force`).
+
+    The latest week is always rebuilt, since it may have been built before its data was complete.
+    """
+    if report_ends is None:
+        report_ends = get_report_period()
+    if not len(report_ends):
+        return []
+    latest = max(report_ends)
+    report_ends = [d for d in report_ends if force or d == latest or not os.path.isdir(report_dir(d, root))]
+    version = table_version('daily_summary')
+    df_daily, media = load_data(['daily_summary', 'latest_media'])
+    weekly = WeeklySummary(weekly_summaries(df_daily, version = version))
+    media = media.assign(timestamp = pd.to_datetime(media['timestamp']))
+    paths = [build_week_artifacts(weekly, media, d, root) for d in report_ends]
+    return [path for path in paths if path is not None]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Precompute the weekly report artifacts')
+    parser.add_argument('--root', default = REPORT_DIR)
+    parser.add_argument('--force', action = 'store_true', help = 'rebuild weeks that already have artifacts')
+    args = parser.parse_args()
+    for path in run(root = args.root, force = args.force):
+        print(path)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Declared dtype kind of the columns of each table, applied to every frame modules.db reads:
+#   'category' - low-cardinality strings (account names, media types)
+#   'datetime' - parsed timestamps
+#   'count'    - integer counts as int32, wide enough that sums of two counts cannot overflow
+#   'float'    - ratios and rates, stored as float32
+_MEDIA_SCHEMA = {
+    'name': 'category',
+    'timestamp': 'datetime',
+    'date': 'datetime',
+    'media_type': 'category',
+    'like_count': 'count',
+    'comments_count': 'count',
+    'engagement': 'count',
+}
+
+SCHEMAS = {
+    'daily_summary': {
+        'id': 'count',
+        'name': 'category',
+        'date': 'datetime',
+        'followers_count': 'count',
+        'follows_count': 'count',
+        'media_count': 'count',
+        'like_count': 'count',
+        'comments_count': 'count',
+    },
+    'latest_media': _MEDIA_SCHEMA,
+    'weekly_media': _MEDIA_SCHEMA,
+    'test_weekly_media': _MEDIA_SCHEMA,
+    'weekly_summary': {
+        '이름': 'category',
+        '날짜': 'datetime',
+    },
+}
+
+COUNT_DTYPE = np.int32
+FLOAT_DTYPE = np.float32
+
+def _convert(s:pd.Series, kind:str):
+    if kind == 'category':
+        return s if isinstance(s.dtype, pd.CategoricalDtype) else s.astype('category')
+    if kind == 'datetime':
+        return pd.to_datetime(s)
+    if kind == 'count':
+        s = pd.to_numeric(s)
+        if s.isna().any():
+            return s.astype(FLOAT_DTYPE)
+        if len(s) and s.abs().max() > np.iinfo(COUNT_DTYPE).max // 2:
+            return s.astype(np.int64)
+        return s.astype(COUNT_DTYPE)
+    if kind == 'float':
+        return s.astype(FLOAT_DTYPE)
+    raise ValueError(f'Unknown column kind: {kind}')
+
+def apply_schema(df:pd.DataFrame, db_name:str):
+    """Casts the declared columns of `db_name` in `df` to their compact dtypes.
+
+    Undeclared float64 columns (ratios, rates and summaries) become float32. Columns that are
+    already in their compact dtype are left as they are, so applying the schema twice is cheap.
+
+    Args:
+        df (pd.DataFrame): Frame read from or written to `db_name`
+        db_name (str): Table name, a key of SCHEMAS
+
+    Returns:
+        pd.DataFrame: The frame with compact dtypes
+    """
+    schema = SCHEMAS.get(db_name, dict())
+    converted = {c: _convert(df[c], kind) for c, kind in schema.items() if c in df.columns}
+    converted = {c: s for c, s in converted.items() if s.dtype != df[c].dtype}
+    converted.update({c: df[c].astype(FLOAT_DTYPE) for c in df.columns if c not in schema and df[c].dtype == np.float64})
+    if not converted:
+        return df
+    return df.assign(**converted)
+
+def memory_usage(df:pd.DataFrame):
+    """Bytes held by `df`, including the strings of object columns."""
+    return int(df.memory_usage(index = True, deep = True).sum())
@@ -0,0 +1,139 @@
+import functools
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+from streamlit import runtime
+from modules import profiling
+from modules.schema import memory_usage
+
+def process_singleton(func):
+    """st.experimental_singleton that also holds outside the Streamlit server.
+
+    experimental_singleton only caches inside a running server, so tests, the benchmarks and
+    the batch CLIs would get a new store on every call. There the result is kept in a plain
+    per-process dict instead. `clear()` empties both.
+    """
+    server = st.experimental_singleton(func)
+    instances = dict()
+    lock = threading.Lock()
+
+    @functools.wraps(func)
+    def wrapper(*args):
+        if runtime.exists():
+            return server(*args)
+        with lock:
+            if args not in instances:
+                instances[args] = func(*args)
+            return instances[args]
+
+    def clear():
+        server.clear()
+        with lock:
+            instances.clear()
+    wrapper.clear = clear
+    return wrapper
+
+def freeze(df:pd.DataFrame):
+    """Marks the numpy blocks of `df` read-only, so an in-place write raises instead of reaching other sessions."""
+    for block in df._mgr.blocks:
+        if isinstance(block.values, np.ndarray):
+            block.values.flags.writeable = False
+    return df
+
+def view(df:pd.DataFrame):
+    """A shallow copy of a shared frame for one session.
+
+    The data is not copied. Adding, replacing or renaming columns only changes the view,
+    while writing into existing cells fails on frozen frames.
+    """
+    return df.copy(deep = False)
+
+# Bytes of frames the shared store may hold before it drops the least recently used entries
+SHARED_MAX_BYTES = 512 * 1024 ** 2
+
+def _size(value):
+    if isinstance(value, pd.DataFrame):
+        return memory_usage(value)
+    if isinstance(value, dict):
+        return sum(_size(v) for v in value.values())
+    return 0
+
+class SharedStore():
+    """Frames and derived results held once per process and handed to every session.
+
+    Each entry is built by the first session that asks for it at a given `version` (e.g.
+    the latest date of the data it derives from). Sessions arriving meanwhile wait for
+    that build instead of running their own, and get a view of the same frozen frame.
+    Once the frames held exceed `max_bytes`, the least recently used entries are dropped,
+    so memory stays flat however many periods or weeks the sessions ask for.
+    Hits and misses are counted per key prefix (the first element of tuple keys).
+    """
+    def __init__(self, max_bytes:int = SHARED_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._locks = dict()
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key, build, version = None):
+        """Returns a view of the entry for `key`, calling `build()` when it is missing or its version changed."""
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+            prefix = key[0] if isinstance(key, tuple) else key
+            if entry is None or entry['version'] != version:
+                self._counters[(prefix, 'misses')] += 1
+                profiling.mark('miss')
+                value = build()
+                if isinstance(value, pd.DataFrame):
+                    freeze(value)
+                entry = {'version': version, 'value': value, 'bytes': _size(value)}
+                with self._lock:
+                    self._entries[key] = entry
+                    self._entries.move_to_end(key)
+                    self._evict(keep = key)
+            else:
+                self._counters[(prefix, 'hits')] += 1
+        value = entry['value']
+        return view(value) if isinstance(value, pd.DataFrame) else value
+
+    def _evict(self, keep):
+        total = sum(entry['bytes'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)['bytes']
+            lock = self._locks.get(key)
+            if lock is not None and not lock.locked():
+                del self._locks[key]
+
+    def clear(self):
+        """Drops every entry. The hit/miss counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """{key: bytes} of the frames currently held."""
+        with self._lock:
+            return {key: entry['bytes'] for key, entry in self._entries.items() if entry['bytes']}
+
+    def counters(self):
+        """{key prefix: {'hits': n, 'misses': n}} since the process started."""
+        counters = dict()
+        for (prefix, kind), n in list(self._counters.items()):
+            counters.setdefault(prefix, {'hits': 0, 'misses': 0})[kind] = n
+        return counters
+
+@process_singleton
+def shared_store():
+    return SharedStore()
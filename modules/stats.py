@@ -1,42 +1,174 @@
+import numpy as np
+import pandas as pd
+from modules import profiling
+from modules.schema import FLOAT_DTYPE
+
+def _summary_columns(df):
+    return [c for c in df.columns if ('count' in c) or ('ratio' in c) or (c == 'rank') or ('rate' in c)]
+
+def _shift(values, periods):
+    shifted = np.full_like(values, np.nan)
+    if periods < len(values):
+        shifted[periods:] = values[:len(values) - periods]
+    return shifted
+
+def _ffill_groups(values, group_start):
+    """Forward-fills NaNs column-wise without crossing group boundaries."""
+    n_rows, n_cols = values.shape
+    last_valid = np.where(np.isnan(values), -1, np.arange(n_rows)[:, None])
+    last_valid = np.maximum.accumulate(last_valid, axis = 0)
+    filled = values[np.maximum(last_valid, 0), np.arange(n_cols)]
+    filled[last_valid < group_start[:, None]] = np.nan
+    return filled
+
+def summarize(df:pd.DataFrame, summary_func:iter = ['diff'], periods:iter = [1]):
+    """Computes every (summary_func, period) block in a single pass over `df`.
+
+    Rows are sorted once by (name, date) and each period is a shifted view of the same
+    array, masked where the shift crosses into another account.
+
+    Args:
+        df (pd.DataFrame): Daily summary with `name`, `date` and the count/ratio/rate columns
+        summary_func (iterable): 'diff' and/or 'pct_change'
+        periods (iterable): Number of rows (days) to compare against
+
+    Returns:
+        dict: {(summary_func, period): pd.DataFrame} of float32 columns aligned with `df.index`
+    """
+    columns = _summary_columns(df)
+    codes = pd.factorize(df['name'])[0]
+    if 'date' in df.columns:
+        order = np.lexsort((df['date'].to_numpy(), codes))
+    else:
+        order = np.argsort(codes, kind = 'stable')
+    n_rows = len(order)
+    inverse = np.empty(n_rows, dtype = int)
+    inverse[order] = np.arange(n_rows)
+
+    sorted_codes = codes[order]
+    values = df[columns].to_numpy(dtype = float)[order]
+    is_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]] if n_rows else np.zeros(0, dtype = bool)
+    group_start = np.maximum.accumulate(np.where(is_start, np.arange(n_rows), 0)) if n_rows else np.zeros(0, dtype = int)
+    position = np.arange(n_rows) - group_start
+    filled = _ffill_groups(values, group_start) if 'pct_change' in summary_func else None
+
+    summaries = dict()
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        for p in periods:
+            invalid = (position < p) | (sorted_codes < 0)
+            for s in summary_func:
+                if s == 'diff':
+                    shifted = _shift(values, p)
+                    result = values - shifted
+                elif s == 'pct_change':
+                    shifted = _shift(filled, p)
+                    result = (filled / shifted - 1) * 100
+                else:
+                    raise ValueError(f'Unknown summary_func: {s}')
+                result[invalid] = np.nan
+                block = pd.DataFrame(result[inverse].astype(FLOAT_DTYPE), index = df.index, columns = [c.split('_count')[0] + f'_{s}' for c in columns])
+                if 'rank_diff' in block.columns:
+                    rank_diff = block['rank_diff'].to_numpy()
+                    block['rank_diff'] = np.where(rank_diff != 0, -rank_diff, rank_diff)
+                summaries[(s, p)] = block
+    return summaries
+
+def state_tail(df:pd.DataFrame, periods:iter = [1]):
+    """The last max(periods) rows of each account, all append_day needs from the history.
+
+    pct_change forward-fills gaps from as far back as the history goes, so each account
+    that has older rows also keeps the row just before its tail, holding the last
+    non-null value of each column so far.
+    """
+    n = max(periods)
+    df = df.sort_values('date', kind = 'mergesort').reset_index(drop = True)
+    grouped = df.groupby('name', observed = True, sort = False)
+    from_end = grouped.cumcount(ascending = False)
+    carry = from_end == n
+    gaps = [c for c in _summary_columns(df) if df[c].isna().any()]
+    if gaps and carry.any():
+        df.loc[carry, gaps] = grouped[gaps].ffill().loc[carry]
+    return df.loc[from_end <= n]
+
+def append_day(state:pd.DataFrame, new_day:pd.DataFrame, summary_func:iter = ['diff'], periods:iter = [1]):
+    """Summaries of the rows of one new date without recomputing the history.
+
+    Rank, engagement rate and ratios are computed for `new_day` only, and diffs reach back
+    into `state`, so the cost is O(accounts x max(periods)) whatever the length of the history.
+
+    Args:
+        state (pd.DataFrame): Summarized rows (rank, engagementrate and ratios included) before the new date,
+            as kept by state_tail
+        new_day (pd.DataFrame): Raw daily_summary rows of the new date, one per account
+        summary_func (iterable): 'diff' and/or 'pct_change'
+        periods (iterable): Periods to compute
+
+    Returns:
+        pd.DataFrame: The new rows in the layout of Summary.get_summaries
+    """
+    day = Summary(new_day.copy()).df
+    context = pd.concat([state[day.columns], day], ignore_index = True)
+    df_summaries = Summary.from_summarized(context).get_summaries(summary_func, periods)
+    return df_summaries.iloc[len(state):].set_axis(new_day.index, axis = 0)
+
 class Summary():
-    def __init__(self, df):
+    def __init__(self, df, summarized:bool = False):
         self.df = df
-        self.df['rank'] = self.df.groupby(['date'])['followers_count'].rank(ascending = False, method = 'min').astype(int)
         self.df_summary = {'diff' : dict(), 'pct_change' : dict()}
+        if summarized:
+            return
+        self.df['rank'] = self.df.groupby(['date'])['followers_count'].rank(ascending = False, method = 'min').astype(np.int32)
         self._calc_engage_rate()
         for a, b in [('like', 'media'), ('comments', 'media')]:
             self.df = Summary.calc_ab_ratio(self.df, a, b)
-            
 
+
+    @classmethod
+    def from_summarized(cls, df):
+        """A Summary of rows that already hold rank, engagementrate and the ratios (e.g. the cube's), kept as they are."""
+        return cls(df, summarized = True)
+
+    @profiling.profiled('Summary.get_summaries')
     def get_summaries(self, summary_func:iter = ['diff'], periods:iter = [1], fillna = False):
-        df_summaries = self.df.copy()
+        """Joins the summary blocks onto the base columns in one concat.
+
+        With a single period the columns keep their plain names (`followers_diff`),
+        with several periods each column is suffixed by its period (`followers_diff_7`).
+        """
+        summary_func = list(dict.fromkeys(summary_func))
+        periods = list(dict.fromkeys(periods))
+        self._summarize_all(summary_func, periods)
+        blocks = []
         for s in summary_func:
             for p in periods:
-                self._summarize(summary_func = s, periods = p)
-                df_summaries = df_summaries.join(self.df_summary[s][p])
-        return df_summaries    
+                block = self.df_summary[s][p]
+                if len(periods) > 1:
+                    block = block.add_suffix(f'_{p}')
+                blocks.append(block)
+        df_summaries = pd.concat([self.df] + blocks, axis = 1)
+        if fillna and blocks:
+            summary_columns = [c for block in blocks for c in block.columns]
+            df_summaries[summary_columns] = df_summaries[summary_columns].fillna(0)
+        return df_summaries
+
+    def _summarize_all(self, summary_func, periods):
+        missing_periods = [p for p in periods if any(p not in self.df_summary[s] for s in summary_func)]
+        if not missing_periods:
+            return
+        for (s, p), block in summarize(self.df, summary_func, missing_periods).items():
+            self.df_summary[s].setdefault(p, block)
 
     def _summarize(self, summary_func = 'diff', periods=1, fillna = False):
-        if periods in self.df_summary[summary_func].keys():
-            return    
-        if summary_func == 'diff':
-            defined_func = lambda x: x.diff(periods)
-        elif summary_func == 'pct_change':
-            defined_func = lambda x: x.pct_change(periods) * 100
-        df_summary = self.df.groupby('name')[[c for c in self.df.columns if ('count' in c) or ('ratio' in c) or (c == 'rank') or ('rate' in c)]].transform(defined_func)
-        df_summary.columns = [c.split('_count')[0] + f'_{summary_func}' for c in df_summary.columns]
-        if 'rank_diff' in df_summary.columns:
-            df_summary.loc[df_summary['rank_diff'] != 0, 'rank_diff'] *= -1
+        self._summarize_all([summary_func], [periods])
         if fillna:
-            df_summary = df_summary.fillna(0)
-        self.df_summary[summary_func][periods] = df_summary
-    
+            self.df_summary[summary_func][periods] = self.df_summary[summary_func][periods].fillna(0)
+
     def _calc_engage_rate(self):
-        self.df['engagementrate'] = 100 * (self.df['like_count'] + self.df['comments_count']) / self.df['followers_count']
-    
+        self.df['engagementrate'] = (100.0 * (self.df['like_count'] + self.df['comments_count']) / self.df['followers_count']).astype(FLOAT_DTYPE)
+
     @staticmethod
     def calc_ab_ratio(df, a, b):
-        df[f'{a}_{b}_ratio'] = df[f'{a}_count'] / df[f'{b}_count']
+        df[f'{a}_{b}_ratio'] = (df[f'{a}_count'] / df[f'{b}_count']).astype(FLOAT_DTYPE)
         return df
-    
-    
+
+
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+import modules.db as db
+from modules.bench import synthetic_daily_summary
+from modules.cache import DiskCache
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    monkeypatch.setenv(db.DB_URL_ENV, f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(db, 'disk_cache', DiskCache(str(tmp_path / 'frames')))
+    db._table_store.clear()
+    db.invalidate()
+    yield
+    db._table_store.clear()
+    db.invalidate()
+
+def test_refresh_data_sees_rewritten_rows(sqlite_db):
+    df = synthetic_daily_summary(n_accounts = 3, n_days = 5)[['name', 'date', 'followers_count']]
+    last_date = df['date'].max()
+    db.upsert_data(df.loc[df['date'] < last_date], 'daily_summary')
+    assert len(db.refresh_data('daily_summary')) == 12
+
+    # New day, then the same day again with other counts (a re-run of the ingest)
+    db.upsert_data(df.loc[df['date'] == last_date], 'daily_summary')
+    assert len(db.refresh_data('daily_summary')) == 15
+    db.upsert_data(df.loc[df['date'] == last_date].assign(followers_count = -1), 'daily_summary')
+    refreshed = db.refresh_data('daily_summary')
+    assert len(refreshed) == 15
+    assert (refreshed.loc[refreshed['date'] == last_date, 'followers_count'] == -1).all()
+
+    # An older day rewritten below the high-water mark
+    first_date = df['date'].min()
+    db.upsert_data(df.loc[df['date'] == first_date].assign(followers_count = -2), 'daily_summary')
+    refreshed = db.refresh_data('daily_summary')
+    assert len(refreshed) == 15
+    assert (refreshed.loc[refreshed['date'] == first_date, 'followers_count'] == -2).all()
+
+def test_upsert_adds_the_missing_unique_key(sqlite_db):
+    df = synthetic_daily_summary(n_accounts = 2, n_days = 3)[['name', 'date', 'followers_count']]
+    # A table created before upsert_data, without the UNIQUE index
+    df.head(0).to_sql('daily_summary', db._connect_db(), index = False)
+    db.upsert_data(df, 'daily_summary')
+    db.upsert_data(df.assign(followers_count = 0), 'daily_summary')
+    assert db.load_data('daily_summary')['followers_count'].eq(0).sum() == len(df) == len(db.load_data('daily_summary'))
+
+def test_upsert_fails_on_duplicates(sqlite_db):
+    df = synthetic_daily_summary(n_accounts = 2, n_days = 3)[['name', 'date', 'followers_count']]
+    pd.concat([df, df]).to_sql('daily_summary', db._connect_db(), index = False)
+    with pytest.raises(db.DuplicateKeyError):
+        db.upsert_data(df, 'daily_summary')
+
+def test_dedupe_table_keeps_the_last_rows(sqlite_db):
+    df = synthetic_daily_summary(n_accounts = 2, n_days = 3)[['name', 'date', 'followers_count']]
+    pd.concat([df, df.assign(followers_count = 7)]).to_sql('daily_summary', db._connect_db(), index = False)
+    with pytest.raises(db.DuplicateKeyError):
+        db.upsert_data(df, 'daily_summary')
+
+    assert db.dedupe_table('daily_summary') == len(df)
+    loaded = db.load_data('daily_summary')
+    assert len(loaded) == len(df) and loaded['followers_count'].eq(7).all()
+    db.upsert_data(df, 'daily_summary')
+    assert len(db.load_data('daily_summary')) == len(df)
+
+def test_disk_cache_prunes_unused_entries(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    frame = pd.DataFrame({'a': [1, 2]})
+    cache.get(('old', 1), lambda: frame, token = 't')
+    cache.get(('used', 1), lambda: frame, token = 't')
+    old_path = cache._paths(('old', 1))[0]
+    past = time.time() - 3600
+    os.utime(old_path, (past, past))
+    os.utime(cache._paths(('used', 1))[0], (past, past))
+    cache.get(('used', 1), lambda: None, token = 't')  # a hit marks the entry as used
+    cache.prune(max_age = 60)
+    assert cache.read_meta(('old', 1)) is None and not os.path.exists(old_path[:-len('.parquet')] + '.json')
+    assert cache.read_meta(('used', 1)) is not None
+
+def test_disk_cache_prune_skips_busy_entries(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    frame = pd.DataFrame({'a': [1, 2]})
+    cache.get(('busy', 1), lambda: frame, token = 't')
+    path = cache._paths(('busy', 1))[0]
+    past = time.time() - 3600
+    os.utime(path, (past, past))
+    held, release = threading.Event(), threading.Event()
+
+    def hold():
+        with cache._key_lock(('busy', 1)):
+            held.set()
+            release.wait(5)
+    holder = threading.Thread(target = hold)
+    holder.start()
+    held.wait(5)
+    cache.get(('other', 1), lambda: frame, token = 't')
+    cache.prune(max_age = 60)  # returns at once, leaving the busy entry alone
+    release.set()
+    holder.join()
+    assert os.path.exists(path)
+    cache.prune(max_age = 60)
+    assert not os.path.exists(path)
@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+from modules.bench import synthetic_daily_summary
+from modules.downsample import downsample, lttb, PX_PER_POINT
+
+def test_lttb_keeps_ends_and_peaks():
+    x = np.arange(1000.)
+    y = np.sin(x / 50)
+    y[500] = 10
+    kept = lttb(x, y, 100)
+    assert len(kept) == 100 and kept[0] == 0 and kept[-1] == 999 and 500 in kept
+    assert np.all(np.diff(kept) > 0)
+
+def test_downsample_bounds_points_per_account():
+    width = 300
+    df = synthetic_daily_summary(n_accounts = 3, n_days = 1500)
+    for days, rule in [(50, None), (300, None), (1500, 'W')]:
+        window = df.loc[df['date'] > df['date'].max() - pd.Timedelta(days = days)]
+        out, used = downsample(window, 'date', 'name', 'followers_count', width)
+        assert used == rule
+        assert out.groupby('name').size().max() <= width // PX_PER_POINT
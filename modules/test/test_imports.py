@@ -0,0 +1,5 @@
+from modules.importtime import PAGE_IMPORTS, measure
+
+def test_pages_defer_heavy_imports():
+    for page, modules in PAGE_IMPORTS.items():
+        assert measure(modules)['heavy'] == [], page
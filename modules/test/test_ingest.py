@@ -0,0 +1,102 @@
+import asyncio
+import re
+import pandas as pd
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from modules.ingest import ingest
+
+FIELDS = re.compile(r'business_discovery\.username\((?P<username>[^)]+)\)\{(?P<inner>.*)\}$')
+EDGE = re.compile(r'media\.limit\((?P<limit>\d+)\)(\.after\((?P<after>[^)]+)\))?')
+
+def fake_accounts(n_accounts = 3, n_media = 7):
+    return {
+        f'user{i}': {
+            'profile': {'id': str(i), 'username': f'user{i}', 'name': f'Account {i}', 'followers_count': 100 * i, 'follows_count': i, 'media_count': n_media},
+            'media': [{'id': f'{i}-{j}', 'permalink': f'https://instagram.com/p/{i}-{j}', 'timestamp': '2022-10-01T10:00:00+0000', 'media_type': 'IMAGE', 'like_count': j, 'comments_count': 1} for j in range(n_media)],
+        }
+        for i in range(n_accounts)
+    }
+
+def fake_graph_app(accounts, fail_first = ()):
+    failures = set(fail_first)
+
+    async def handler(request):
+        match = FIELDS.match(request.query['fields'])
+        username = match['username']
+        if username in failures:
+            failures.discard(username)
+            return web.json_response({'error': {'message': 'throttled', 'code': 4}}, status = 400)
+        if username not in accounts:
+            return web.json_response({'error': {'message': 'not found', 'code': 110}}, status = 400)
+        account = accounts[username]
+        edge = EDGE.match(match['inner'])
+        if edge is None:
+            return web.json_response({'business_discovery': account['profile']})
+        limit, start = int(edge['limit']), int(edge['after'] or 0)
+        media = {'data': account['media'][start:start + limit], 'paging': {'cursors': {'after': str(start + limit)}}}
+        if start + limit < len(account['media']):
+            media['paging']['next'] = 'next'
+        return web.json_response({'business_discovery': {'media': media}})
+
+    app = web.Application()
+    app.router.add_get('/{ig_user_id}', handler)
+    return app
+
+def run_ingest(accounts, usernames, fail_first = (), write = None):
+    writes = []
+    if write is None:
+        write = lambda df, table: writes.append((table, df))
+
+    async def main():
+        async with TestServer(fake_graph_app(accounts, fail_first)) as server:
+            return await asyncio.wait_for(ingest(usernames, 'token', '1234', write = write, base_url = str(server.make_url('')), batch_size = 4, backoff = 0), timeout = 30)
+
+    return asyncio.run(main()), writes
+
+def test_ingest_streams_paged_media_and_summaries():
+    accounts = fake_accounts()
+    result, writes = run_ingest(accounts, list(accounts), fail_first = ['user1'])
+
+    assert result.failed == {}
+    assert result.written == {'latest_media': 21, 'daily_summary': 3}
+    media_rows = sum(len(df) for table, df in writes if table == 'latest_media')
+    assert media_rows == 21
+    summaries = {row['name']: row for table, df in writes if table == 'daily_summary' for row in df.to_dict('records')}
+    assert summaries['Account 2']['followers_count'] == 200
+    assert summaries['Account 2']['like_count'] == sum(range(7))
+
+def test_ingest_reports_failed_accounts():
+    accounts = fake_accounts(n_accounts = 1)
+    result, _ = run_ingest(accounts, ['user0', 'missing'])
+
+    assert list(result.failed) == ['missing']
+    assert result.written['daily_summary'] == 1
+
+def test_ingest_raises_when_the_writer_fails():
+    def write(df, table):
+        raise ConnectionError('database is down')
+
+    # 500 posts are 10 pages for a queue of 4 items, so the producer blocks once the writer is gone
+    with pytest.raises(ConnectionError):
+        run_ingest(fake_accounts(n_accounts = 1, n_media = 500), ['user0'], write = write)
+
+def test_ingested_timestamps_load_in_a_kst_date_window(tmp_path, monkeypatch):
+    import modules.db as db
+    from modules.cache import DiskCache
+    monkeypatch.setenv(db.DB_URL_ENV, f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(db, 'disk_cache', DiskCache(str(tmp_path / 'frames')))
+    db._table_store.clear()
+    db.invalidate()
+
+    result, _ = run_ingest(fake_accounts(n_accounts = 2, n_media = 3), ['user0', 'user1'], write = db.upsert_data)
+    assert result.written['latest_media'] == 6
+
+    # 10:00 UTC is 19:00 KST on the same day
+    media = db.load_data('latest_media')
+    assert str(media['timestamp'].dtype) == 'datetime64[ns]'
+    assert (media['timestamp'] == pd.Timestamp('2022-10-01 19:00')).all()
+    window = db.load_window('latest_media', start = '2022-10-01', end = '2022-10-01 23:59')
+    assert len(window) == 6
+    db._table_store.clear()
+    db.invalidate()
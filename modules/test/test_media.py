@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from modules.bench import synthetic_media
+from modules.media import MediaIndex
+from modules.report_batch import indexed_top_posts, top_engagement_posts
+
+def test_top_k_index():
+    media = synthetic_media(n_accounts = 6, n_posts = 200, n_days = 60)
+    index = MediaIndex(media)
+    for sort_key in ['like_count', 'comments_count']:
+        expected = media.loc[media['name'] == 'account_002'].sort_values(sort_key, ascending = False, kind = 'mergesort')
+        assert index.page('account_002', sort_key, offset = 20, limit = 6)['permalink'].tolist() == expected['permalink'].iloc[20:26].tolist()
+
+    report_end = pd.Timestamp('2022-12-26')
+    week_media = media.loc[media['timestamp'].between(report_end - pd.Timedelta(days = 7), report_end)]
+    week_media = week_media.assign(engagement = week_media['like_count'] + week_media['comments_count'])
+    week_summary = pd.DataFrame({'이름': [f'account_{i:03d}' for i in range(5)], '팔로워 수': np.arange(1000, 6000, 1000)})
+    expected = top_engagement_posts(week_summary, week_media)
+    result = indexed_top_posts(index.top, week_summary, report_end)
+    key = ['scope', 'permalink', 'engagementRate']
+    pd.testing.assert_frame_equal(result[key].sort_values(key[:2]).reset_index(drop = True), expected[key].sort_values(key[:2]).reset_index(drop = True))
+
+def test_top_k_index_keeps_missing_counts_last():
+    media = synthetic_media(n_accounts = 1, n_posts = 50, n_days = 30).astype({'like_count': float})
+    media.loc[media.index[:5], 'like_count'] = np.nan
+    index = MediaIndex(media)
+    pages = [index.page('account_000', 'like_count', offset = offset, limit = 10) for offset in range(0, index.count('account_000'), 10)]
+    liked = pd.concat(pages)['like_count']
+    assert len(liked) == index.count('account_000') == 50
+    assert liked.iloc[:45].notna().all() and liked.iloc[45:].isna().all()
+    assert liked.iloc[:45].is_monotonic_decreasing
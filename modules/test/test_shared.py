@@ -0,0 +1,13 @@
+import pandas as pd
+from modules.shared import SharedStore
+from modules.schema import memory_usage
+
+def test_shared_store_evicts_least_recently_used():
+    frame = pd.DataFrame({'a': range(1000)})
+    store = SharedStore(max_bytes = 2 * memory_usage(frame))
+    for period in [1, 2]:
+        store.get(('summary', period), lambda: frame.copy(), version = 'v')
+    store.get(('summary', 1), lambda: frame.copy(), version = 'v')
+    store.get(('summary', 3), lambda: frame.copy(), version = 'v')
+    assert set(store.stats()) == {('summary', 1), ('summary', 3)}
+    assert store.counters()['summary'] == {'hits': 1, 'misses': 3}
@@ -1,9 +1,110 @@
-from modules.stats import Summary
+import numpy as np
 import pandas as pd
+from modules.bench import run, synthetic_daily_summary
+from modules.cube import build_cube, load_summary_cube, materialize_cube
+from modules.stats import Summary, append_day, state_tail
 
-df = pd.read_csv("../../data/df_daily_summary.csv")
+COUNT_COLUMNS = ['followers_count', 'follows_count', 'media_count', 'like_count', 'comments_count']
 
-summarizer = Summary(df)
+def reference_summary(df, summary_func, period):
+    """The original per-account groupby implementation."""
+    df = df.sort_values('date').copy()
+    df['rank'] = df.groupby('date')['followers_count'].rank(ascending = False, method = 'min')
+    df['engagementrate'] = 100 * (df['like_count'] + df['comments_count']) / df['followers_count']
+    df['like_media_ratio'] = df['like_count'] / df['media_count']
+    df['comments_media_ratio'] = df['comments_count'] / df['media_count']
+    columns = COUNT_COLUMNS + ['rank', 'engagementrate', 'like_media_ratio', 'comments_media_ratio']
+    grouped = df.groupby('name')[columns]
+    result = grouped.diff(period) if summary_func == 'diff' else grouped.pct_change(period) * 100
+    if summary_func == 'diff':
+        result['rank'] = -result['rank']
+    result.columns = [c.split('_count')[0] + f'_{summary_func}' for c in columns]
+    return result
 
 def test_summary():
-    pass
\ No newline at end of file
+    df = synthetic_daily_summary(n_accounts = 5, n_days = 60)
+    df = df.drop(index = df.sample(frac = 0.1, random_state = 0).index)
+    summarizer = Summary(df.sort_values('date'))
+    for period in [1, 7, 28]:
+        df_summaries = summarizer.get_summaries(['diff', 'pct_change'], [period])
+        for summary_func in ['diff', 'pct_change']:
+            expected = reference_summary(df, summary_func, period)
+            pd.testing.assert_frame_equal(df_summaries[expected.columns], expected.loc[df_summaries.index], check_dtype = False, rtol = 1e-3, atol = 1e-3)
+
+def test_append_day():
+    df = synthetic_daily_summary(n_accounts = 5, n_days = 40)
+    last_date = df['date'].max()
+    periods = [1, 7]
+    history = Summary(df.loc[df['date'] < last_date].sort_values('date')).df
+    new_day = df.loc[df['date'] == last_date]
+    appended = append_day(state_tail(history, periods), new_day, ['diff', 'pct_change'], periods)
+    expected = Summary(df.sort_values('date')).get_summaries(['diff', 'pct_change'], periods).loc[new_day.index]
+    pd.testing.assert_frame_equal(appended[expected.columns], expected, check_dtype = False, check_categorical = False)
+
+def test_append_day_across_gaps():
+    df = synthetic_daily_summary(n_accounts = 3, n_days = 40).astype({'like_count': float})
+    last_date = df['date'].max()
+    # No like counts for the 10 days before the last one, more than the 7 rows the state keeps
+    gap = df['date'].between(last_date - pd.Timedelta(days = 10), last_date - pd.Timedelta(days = 1)) & (df['name'] == 'account_001')
+    df.loc[gap, 'like_count'] = np.nan
+    periods = [1, 7]
+    history = Summary(df.loc[df['date'] < last_date].sort_values('date')).df
+    new_day = df.loc[df['date'] == last_date]
+    appended = append_day(state_tail(history, periods), new_day, ['pct_change'], periods)
+    expected = Summary(df.sort_values('date')).get_summaries(['pct_change'], periods).loc[new_day.index]
+    assert appended['like_pct_change_7'].notna().all()
+    pd.testing.assert_frame_equal(appended[expected.columns], expected, check_dtype = False, check_categorical = False)
+
+def test_materialize_cube(tmp_path):
+    df = synthetic_daily_summary(n_accounts = 4, n_days = 120)
+    path = str(tmp_path / 'cube.parquet')
+    split = df['date'].max() - pd.Timedelta(days = 3)
+    materialize_cube(df.loc[df['date'] <= split], path = path)
+    cube = materialize_cube(df.loc[df['date'] > split], path = path)
+    expected = build_cube(df)
+    key = ['period', 'date', 'name']
+    cube = cube[expected.columns].astype({'name': str}).sort_values(key).reset_index(drop = True)
+    expected = expected.sort_values(key).reset_index(drop = True)
+    pd.testing.assert_frame_equal(cube, expected, check_dtype = False, rtol = 1e-5)
+
+def test_materialize_cube_late_rows(tmp_path):
+    df = synthetic_daily_summary(n_accounts = 4, n_days = 60)
+    path = str(tmp_path / 'cube.parquet')
+    # One account of a day 10 days back arrives only after the cube was built
+    late = (df['date'] == df['date'].max() - pd.Timedelta(days = 10)) & (df['name'] == 'account_002')
+    materialize_cube(df.loc[~late], path = path)
+    cube = materialize_cube(df, path = path)
+    expected = build_cube(df)
+    key = ['period', 'date', 'name']
+    cube = cube[expected.columns].astype({'name': str}).sort_values(key).reset_index(drop = True)
+    expected = expected.sort_values(key).reset_index(drop = True)
+    pd.testing.assert_frame_equal(cube, expected, check_dtype = False, rtol = 1e-5)
+
+def test_summary_cube_per_path(tmp_path):
+    df = synthetic_daily_summary(n_accounts = 2, n_days = 30)
+    cube_a = load_summary_cube(df, path = str(tmp_path / 'a.parquet'))
+    cube_b = load_summary_cube(df.loc[df['name'] == 'account_000'], path = str(tmp_path / 'b.parquet'))
+    assert cube_a is not cube_b
+    assert set(cube_b.slice(1)['name']) == {'account_000'}
+    assert load_summary_cube(df, path = str(tmp_path / 'a.parquet')) is cube_a
+
+def test_summary_cube_sees_rewritten_counts(tmp_path):
+    df = synthetic_daily_summary(n_accounts = 2, n_days = 30)
+    path = str(tmp_path / 'cube.parquet')
+    last = df['date'] == df['date'].max()
+    rewritten = df.assign(followers_count = df['followers_count'].where(~last, df['followers_count'] + 5000))
+    for version, new_version in [(None, None), ('v1', 'v2')]:
+        cube = load_summary_cube(df, path = path, version = version)
+        assert load_summary_cube(df, path = path, version = version) is cube
+        # Same dates and row count, other counts on the last day (a re-run of the ingest)
+        fresh = load_summary_cube(rewritten, path = path, version = new_version)
+        assert fresh is not cube
+        latest = fresh.slice(1, dates = [df['date'].max()])
+        assert latest['followers_count'].tolist() == rewritten.loc[last, 'followers_count'].tolist()
+        load_summary_cube(df, path = path, version = 'v0')
+
+def test_bench():
+    report = run(n_accounts = 3, n_days = 30, n_posts = 10, repeat = 1)
+    assert report['params']['daily_rows'] == 90
+    assert {'summary_init', 'get_summaries_1_7_28_90', 'translate_warm', 'reports_prep_cold', 'load_data_cold'} <= set(report['results'])
+    assert all(np.isfinite(r['median']) for r in report['results'].values())
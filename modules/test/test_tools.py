@@ -0,0 +1,36 @@
+import pandas as pd
+from modules.bench import synthetic_media
+from modules.export import export_file, iter_csv
+from modules.schema import apply_schema
+from modules.tools import query_table
+
+def test_query_table():
+    media = apply_schema(synthetic_media(n_accounts = 4, n_posts = 300), 'latest_media')
+    page, n_rows = query_table(media, search = 'account_001', sort_by = 'like_count', ascending = False, offset = 10, limit = 20)
+    expected = media.loc[media['name'] == 'account_001'].sort_values('like_count', ascending = False, kind = 'mergesort')
+    assert n_rows == 300
+    assert page.index.tolist() == expected.index[10:30].tolist()
+
+    page, n_rows = query_table(media, group_by = 'name', agg = 'sum', sort_by = 'like_count')
+    assert n_rows == 4
+    assert page['행 수'].tolist() == [300] * 4
+    assert page['like_count'].is_monotonic_increasing
+    assert page['like_count'].sum() == media['like_count'].sum()
+
+def test_export_file(tmp_path):
+    media = synthetic_media(n_accounts = 2, n_posts = 50)
+    columns = ['name', 'permalink', 'like_count']
+    assert b''.join(iter_csv(media[columns], chunk_rows = 7)) == media[columns].to_csv().encode('utf-8')
+
+    loads = []
+    def load():
+        loads.append(1)
+        return media
+    week = media['date'].max()
+    path = export_file('latest_media', week, columns, load, version = 'v1', root = str(tmp_path))
+    assert export_file('latest_media', week, columns, load, version = 'v1', root = str(tmp_path)) == path
+    assert len(loads) == 1
+    export_file('latest_media', week, columns, load, version = 'v2', root = str(tmp_path))
+    assert len(loads) == 2
+    parquet = export_file('latest_media', week, columns, load, fmt = 'Parquet', version = 'v2', root = str(tmp_path))
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet), media[columns])
@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from modules import profiling
+from modules.dates import week_label
 
 def st_header(text:str, num = 1):
     return st.markdown(f"{'#' * num} {text}")
@@ -14,25 +16,45 @@ def inc_dec(number):
         text = '로 변동이 없었습니다.'
     return text
 
+TRANS_DICT = {'rank': '순위', 'name': '이름', 'followers' : '팔로워', 'follows': '팔로우', 'media': '게시물', 'like': '좋아요', 'comments': '댓글', 'diff': '증감(수)', 'pct_change': '증감(%)', 'count': '수', 'ratio': '당', 'date': '날짜', 'engagementrate': '참여도',
+'carousel': '캐러셀', 'album': '앨범', 'image': '이미지', 'video': '영상', 'engagement': '참여 수', 'type': '종류', 'timestamp': '업로드 시간', 'permalink': '게시물 주소', 'caption': '캡션'}
+
+@lru_cache(maxsize = None)
+def _translate_name(name):
+    name = name.lower()
+    if 'pct_change' in name:
+        head, _, tail = name.partition('_pct_change')
+        splitted = head.split('_') + ['pct_change'] + [w for w in tail.split('_') if w]
+    else:
+        splitted = name.split('_')
+    if 'ratio' in splitted:
+        splitted.insert(2, splitted.pop(0))
+    trans_words = []
+    for word in splitted:
+        if TRANS_DICT.get(word):
+            word = TRANS_DICT[word]
+        elif word.isdigit():
+            word = f'{word}일'
+        trans_words.append(word)
+    return ' '.join(trans_words).strip()
+
+@lru_cache(maxsize = 256)
+def _translate_columns(columns:tuple):
+    return tuple(_translate_name(name) for name in columns)
+
+@profiling.profiled('translate')
 def translate(column_or_index):
-    trans_dict = {'rank': '순위', 'name': '이름', 'followers' : '팔로워', 'follows': '팔로우', 'media': '게시물', 'like': '좋아요', 'comments': '댓글', 'diff': '증감(수)', 'pct_change': '증감(%)', 'count': '수', 'ratio': '당', 'date': '날짜', 'engagementrate': '참여도',
-    'carousel': '캐러셀', 'album': '앨범', 'image': '이미지', 'video': '영상', 'engagement': '참여 수', 'type': '종류', 'timestamp': '업로드 시간', 'permalink': '게시물 주소', 'caption': '캡션'}
-    trans_names = []
-    for name in column_or_index:
-        name = name.lower()
-        trans_words = ''
-        if 'pct_change' in name:
-            splitted = name.split('_pct_change')[0].split('_') + ['pct_change']
-        else:
-            splitted = name.split('_')
-        if 'ratio' in splitted:
-            splitted.insert(2, splitted.pop(0))
-        for word in splitted:
-            if trans_dict.get(word):
-                word = trans_dict[word]
-            trans_words += word + ' '
-        trans_names.append(trans_words.strip())
-    return trans_names
+    return list(_translate_columns(tuple(column_or_index)))
+
+def translation_map(column_or_index):
+    """{column: translated name} for renaming or display."""
+    columns = tuple(column_or_index)
+    return dict(zip(columns, _translate_columns(columns)))
+
+def reverse_translation_map(column_or_index):
+    """{translated name: column}, to get back to the stable English columns from a displayed name."""
+    columns = tuple(column_or_index)
+    return dict(zip(_translate_columns(columns), columns))
 
 def date_format(datetime, format = 'kor'):
     if format == 'kor':
@@ -46,16 +68,7 @@ def date_format(datetime, format = 'kor'):
         return datetime.strftime(strf)
 
 def get_week_num(date, ref_weekday = 0):
-
-    target_day = pd.to_datetime(date)
-    year = target_day.year
-    month = target_day.month
-    first_day = pd.to_datetime(datetime(year, month, 1, tzinfo = timezone(timedelta(hours = 9))))
-    n = 0
-    for day in pd.date_range(start = first_day, end = target_day):
-        if day.day_of_week == ref_weekday:
-            n += 1
-    return f'{year}년 {month}월 {n}주차'
+    return week_label(date, ref_weekday)
 
 def show_glossary():
     content = '''
@@ -1,17 +1,96 @@
 import streamlit as st
-from st_aggrid import AgGrid,GridOptionsBuilder
-from st_aggrid.shared import GridUpdateMode
 import pandas as pd
 
-def aggrid_interactive_table(df: pd.DataFrame):
+# Tables with more rows than this are sorted, filtered, grouped and paged in Python
+SERVER_SIDE_ROWS = 1000
+AGG_FUNCS = {'합계': 'sum', '평균': 'mean', '최대': 'max', '최소': 'min'}
+
+def query_table(df:pd.DataFrame, search:str = None, sort_by:str = None, ascending:bool = True, group_by:str = None, agg:str = 'sum', offset:int = 0, limit:int = 100):
+    """Computes one page of a table view on the server.
+
+    Args:
+        df (pd.DataFrame): The full (cached) frame
+        search (str, optional): Keeps rows where any text column contains it
+        sort_by (str, optional): Column to sort on
+        ascending (bool, optional): Sort order
+        group_by (str, optional): Column to group on. Numeric columns are aggregated with `agg`
+            and a '행 수' column counts the rows of each group.
+        agg (str, optional): 'sum', 'mean', 'max' or 'min'
+        offset, limit (int, optional): Rows of the page
+
+    Returns:
+        tuple: (page as a DataFrame, number of rows of the whole view)
+    """
+    df = _table_view(df, search, sort_by, ascending, group_by, agg)
+    return df.iloc[offset:offset + limit], len(df)
+
+def _table_view(df:pd.DataFrame, search:str, sort_by:str, ascending:bool, group_by:str, agg:str):
+    if search:
+        text_columns = df.select_dtypes(include = ['object', 'category']).columns
+        mask = pd.Series(False, index = df.index)
+        for c in text_columns:
+            mask |= df[c].astype(str).str.contains(search, case = False, regex = False, na = False)
+        df = df.loc[mask]
+    if group_by:
+        grouped = df.groupby(group_by, observed = True, sort = False)
+        df = grouped[df.select_dtypes('number').columns.drop(group_by, errors = 'ignore')].agg(agg)
+        df.insert(0, '행 수', grouped.size())
+        df = df.reset_index()
+    if sort_by and sort_by in df.columns:
+        df = df.sort_values(sort_by, ascending = ascending, kind = 'mergesort')
+    return df
+
+def _server_side_table(df:pd.DataFrame, key:str, page_size:int):
+    from st_aggrid import AgGrid
+    from st_aggrid.shared import GridUpdateMode
+
+    text_columns = df.select_dtypes(include = ['object', 'category']).columns.tolist()
+    col1, col2, col3, col4, col5 = st.columns([0.25, 0.2, 0.1, 0.2, 0.1])
+    with col1:
+        search = st.text_input('검색', key = f'{key}_search')
+    with col2:
+        group_by = st.selectbox('그룹', [None] + text_columns, format_func = lambda c: '없음' if c is None else c, key = f'{key}_group')
+    with col3:
+        agg = AGG_FUNCS[st.selectbox('집계', list(AGG_FUNCS), key = f'{key}_agg', disabled = group_by is None)]
+    columns = ([group_by, '행 수'] + df.select_dtypes('number').columns.drop(group_by, errors = 'ignore').tolist()) if group_by else df.columns.tolist()
+    with col4:
+        sort_by = st.selectbox('정렬', columns, key = f'{key}_sort')
+    with col5:
+        ascending = st.checkbox('오름차순', key = f'{key}_ascending')
+
+    view = _table_view(df, search, sort_by, ascending, group_by, agg)
+    n_pages = max((len(view) - 1) // page_size + 1, 1)
+    page_number = st.number_input('페이지', min_value = 1, max_value = n_pages, value = 1, key = f'{key}_page')
+    offset = (min(page_number, n_pages) - 1) * page_size
+    page = view.iloc[offset:offset + page_size]
+    st.caption(f'{len(view)}행 중 {offset + min(len(page), 1)}–{offset + len(page)}')
+    return AgGrid(page.reset_index(drop = True), theme = "streamlit", fit_columns_on_grid_load = True, update_mode = GridUpdateMode.NO_UPDATE, key = f'{key}_grid')
+
+def aggrid_interactive_table(df: pd.DataFrame, key:str = 'table', server_side:bool = None, page_size:int = 100):
     """Creates an st-aggrid interactive table based on a dataframe.
 
+    Small tables are sent whole and grouped, pivoted and aggregated in the browser. Tables over
+    SERVER_SIDE_ROWS rows are only sent a page at a time: search, sort, grouping and
+    aggregation are computed in Python on the frame (see query_table) from widgets above the grid.
+
     Args:
         df (pd.DataFrame]): Source dataframe
+        key (str, optional): Prefix of the widget keys, unique per table on a page
+        server_side (bool, optional): Force either mode. By table size if not given.
+        page_size (int, optional): Rows per page in the server-side mode
 
     Returns:
         dict: The selected row
     """
+    # st_aggrid is imported here so the pages only load it when a table is shown
+    from st_aggrid import AgGrid,GridOptionsBuilder
+    from st_aggrid.shared import GridUpdateMode
+
+    if server_side is None:
+        server_side = len(df) > SERVER_SIDE_ROWS
+    if server_side:
+        return _server_side_table(df, key, page_size)
+
     options = GridOptionsBuilder.from_dataframe(
         df,enableRowGroup=True,enableValue=True,enablePivot=True
     )
@@ -25,7 +104,32 @@ def aggrid_interactive_table(df: pd.DataFrame):
 
     return selection
 
-@st.cache
-def convert_df(df):
-    # IMPORTANT: Cache the conversion to prevent computation on every rerun
-    return df.to_csv().encode('utf-8')
+def download_export(label:str, table:str, week, columns:iter, load, file_name:str, key:str, version = None):
+    """Format picker and a button that builds the export file; the download button only appears after it.
+
+    Nothing is serialized on a plain rerun. The file is written by modules.export on the first
+    request and reused from disk by every later one until `version` changes.
+
+    Args:
+        label (str): Label of the download button
+        table (str), week, columns (iter): What is exported, the key of the file
+        load (callable): Returns the frame to export
+        file_name (str): Downloaded file name, without the extension
+        key (str): Unique widget key
+        version (optional): Freshness token of the data, see modules.export.export_file
+    """
+    from modules.export import FORMATS, available_formats, export_file
+
+    col1, col2 = st.columns([0.3, 0.7])
+    with col1:
+        fmt = st.selectbox('형식', available_formats(), key = f'{key}_format', label_visibility = 'collapsed')
+    request = (str(week), fmt)
+    with col2:
+        if st.button('파일 만들기', key = f'{key}_build'):
+            st.session_state[key] = request
+    if st.session_state.get(key) != request:
+        return
+    path = export_file(table, week, columns, load, fmt, version)
+    ext, mime = FORMATS[fmt]
+    with open(path, 'rb') as f:
+        st.download_button(label = label, data = f, file_name = f'{file_name}.{ext}', mime = mime, key = f'{key}_download')
@@ -0,0 +1,48 @@
+import pandas as pd
+
+def week_key(date):
+    """Normalizes a date-like value to a naive midnight Timestamp (KST wall clock)."""
+    date = pd.Timestamp(date)
+    if date.tzinfo is not None:
+        date = date.tz_localize(None)
+    return date.normalize()
+
+class WeeklySummary():
+    """Weekly summary rows indexed by (week date, account).
+
+    The frame is grouped by its normalized date once, so looking up a week or an account
+    within a week is a dictionary hit instead of a comparison over the whole column.
+    """
+    def __init__(self, df:pd.DataFrame, date_col:str = '날짜', name_col:str = '이름'):
+        dates = pd.to_datetime(df[date_col])
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        self.df = df.assign(**{date_col: dates.dt.normalize()})
+        self.date_col = date_col
+        self.name_col = name_col
+        self._weeks = {key: week for key, week in self.df.groupby(date_col, sort = True)}
+        self._records = dict()
+
+    def __contains__(self, date):
+        return week_key(date) in self._weeks
+
+    @property
+    def dates(self):
+        return list(self._weeks.keys())
+
+    def week(self, date):
+        """Rows of the week ending on `date`. Empty when the week is not stored."""
+        return self._weeks.get(week_key(date), self.df.iloc[0:0])
+
+    def row(self, date, name:str):
+        """The row of `name` for the week ending on `date` as a dict, or None."""
+        key = week_key(date)
+        if key not in self._records:
+            self._records[key] = {r[self.name_col]: r for r in self.week(key).to_dict('records')}
+        return self._records[key].get(name)
+
+    def best(self, date, column:str, n:int = 1):
+        return self.week(date).nlargest(n, column)
+
+    def worst(self, date, column:str, n:int = 1):
+        return self.week(date).nsmallest(n, column)
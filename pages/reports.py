@@ -1,60 +1,66 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.io as pio
-from modules.stats import Summary
-from modules.text import show_glossary, st_header, translate, date_format, get_week_num
-from datetime import datetime, timedelta, timezone
-from modules.db import load_data, get_by_query, insert_data
-from modules.tools import aggrid_interactive_table, convert_df
+from modules.text import show_glossary, st_header, translation_map, reverse_translation_map, date_format
+from modules.dates import get_report_period, report_bounds, week_label, week_labels
+from modules.tools import aggrid_interactive_table, download_export
 from modules.design import Bar, business_colormap
+from modules.weekly import WeeklySummary
 from modules.auth import check_password, signout
+from modules import profiling
 import os
 
-pio.templates.default = "simple_white"
+def save_report_rows(df:pd.DataFrame, db_name:str):
+    """Stores rows computed by the page. A table that still holds duplicate rows is left as is, the page shows the rows anyway."""
+    from modules.db import upsert_data, DuplicateKeyError
+    try:
+        upsert_data(df, db_name)
+    except DuplicateKeyError:
+        st.warning(f'{db_name} has duplicate rows and was not updated. Run `python -m modules.db --dedupe {db_name}`.')
 
 def main():
+    # The db layer (SQLAlchemy) and the report batch are only imported once the password check has passed
+    from modules.db import load_window, refresh_data, table_version, MEDIA_COLUMNS
+    from modules.media import load_top_index
+    from modules.report_batch import load_report_artifacts, report_dir, weekly_summaries, best_worst, indexed_top_posts, ALL_SCOPE, SUMMARY_EXPORT_COLUMNS, MEDIA_EXPORT_COLUMNS
     
-    report_init = pd.to_datetime(datetime(2022, 10, 3, 12, 0, tzinfo = timezone(timedelta(hours = 9))))
-    
-    current_time = pd.to_datetime(datetime.now(tz = timezone(timedelta(hours=9))))
-
-    report_period = pd.date_range(start = report_init, end = current_time, freq = '7D')
+    report_period = get_report_period()
+    report_labels = dict(zip(report_period, week_labels(report_period)))
     
     with st.sidebar:
         target_business = st.selectbox('분석 계정', options = ['winebook_official', 'after9'])
-        report_end = st.selectbox(label = '주차', options = report_period[::-1], format_func = get_week_num)
-        report_start = pd.to_datetime(report_end - timedelta(days = 7))
+        report_end = st.selectbox(label = '주차', options = report_period[::-1], format_func = report_labels.get)
+        report_start, report_end = report_bounds(report_end)
         report_date = report_end
     
-    df_weekly_summary = load_data('weekly_summary')
-    weekly_media = get_by_query(f"SELECT * FROM test_weekly_media WHERE timestamp > '{date_format(report_start, '-')}'")
-    
+    # Weeks precomputed by `python -m modules.report_batch` are read from disk as is
+    artifacts = load_report_artifacts(report_end)
+    if artifacts is not None:
+        previous = load_report_artifacts(report_start)
+        df_weekly_summary = pd.concat([previous['summary'], artifacts['summary']]) if previous is not None else artifacts['summary']
+        weekly_media = artifacts['media']
+        media_source = 'latest_media'
+        weekly = WeeklySummary(df_weekly_summary)
+    else:
+        df_weekly_summary = refresh_data('weekly_summary')
+        media_source = 'test_weekly_media'
+        weekly_media = load_window(media_source, columns = MEDIA_COLUMNS + ('engagement',), after = report_start.normalize())
+        weekly = WeeklySummary(df_weekly_summary)
 
-    if not date_format(report_date) in date_format(df_weekly_summary['날짜']).tolist():
-        with st.spinner(text="Updating data for weekly reports"):
-            df_daily_summary = load_data('daily_summary')
-            df_daily_summary['date'] = pd.to_datetime(df_daily_summary['date'])
-            summarizer = Summary(df_daily_summary.sort_values('date'))
-            df_weekly_summary = summarizer.get_summaries(summary_func=['diff', 'pct_change'], periods = [7])
-            df_weekly_summary.columns = translate(df_weekly_summary.columns)
-            df_weekly_summary = df_weekly_summary.loc[df_weekly_summary['날짜'].dt.dayofweek == 0]
-            
-            insert_data(df_weekly_summary.loc[df_weekly_summary['날짜'] == df_weekly_summary['날짜'].max()], 'weekly_summary')   
+        if report_date not in weekly:
+            with st.spinner(text="Updating data for weekly reports"):
+                df_weekly_summary = weekly_summaries(refresh_data('daily_summary'), version = table_version('daily_summary'))
+                save_report_rows(df_weekly_summary.loc[df_weekly_summary['날짜'] == df_weekly_summary['날짜'].max()], 'weekly_summary')   
+                weekly = WeeklySummary(df_weekly_summary)
     
-    if weekly_media.empty:
-          with st.spinner(text="Updating data for weekly reports"):
-            media = load_data('latest_media')
-            weekly_media = media.loc[media['timestamp'].between(date_format(report_start, format = '-'), date_format(report_end, format = '-'))]
-            weekly_media['engagement'] = weekly_media['like_count'] + weekly_media['comments_count']
-            insert_data(weekly_media, 'weekly_media')
-            
+        if weekly_media.empty:
+              with st.spinner(text="Updating data for weekly reports"):
+                media_source = 'latest_media'
+                weekly_media = load_window(media_source, start = report_start.normalize(), end = report_end.normalize())
+                weekly_media['engagement'] = weekly_media['like_count'] + weekly_media['comments_count']
+                save_report_rows(weekly_media, 'weekly_media')
 
-
-    df_plot_weekly = df_weekly_summary[(df_weekly_summary['날짜'].dt.dayofweek == report_date.dayofweek)]
-    
-    df_plot_weekly['날짜'] = date_format(df_plot_weekly['날짜'])
     all_business = sorted(df_weekly_summary['이름'].unique().tolist())
+    highlights = artifacts['highlights'] if artifacts is not None else dict()
     
     with st.sidebar:
         with st.expander('그래프에 포함'):
@@ -82,7 +88,7 @@ def main():
         col1, col2 = st.columns([0.8, 0.2])
         with col1:
             st_header(target_business, num = 2)
-            st_header(f'{get_week_num(report_end)} 주간 보고서', num = 3)
+            st_header(f'{week_label(report_end)} 주간 보고서', num = 3)
             st.caption(f'분석 기간: {date_format(report_start)} ~ {date_format(report_end)}')
             st.caption(f'작성일: {date_format(report_date)} 월요일' )
             
@@ -95,21 +101,22 @@ def main():
         with st.container():
             st_header('1. 팔로워 수', num = 4)
         
-            largest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nlargest(1, '팔로워 증감(%)')['이름'].values[0]
-            smallest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nsmallest(1, '팔로워 증감(%)')['이름'].values[0]
+            largest_inc, smallest_inc = highlights.get('팔로워 증감(%)') or best_worst(weekly, report_date, '팔로워 증감(%)')
             
             business_to_report = [target_business, largest_inc, smallest_inc]
             metric_header = ['본 계정', 'Weekly Best', 'Weekly Worst']
             cols = st.columns([0.5, 0.25, 0.25])
             for b_idx in range(len(business_to_report)):
                 business = business_to_report[b_idx]
-                report_data = df_weekly_summary.loc[(date_format(df_weekly_summary['날짜']) == date_format(report_date)) & (df_weekly_summary['이름'] == business)].to_dict('records')[0]
+                report_data = weekly.row(report_date, business)
                 with cols[b_idx]:
                     st_header(metric_header[b_idx], num = 5)
                     st.metric(f'{business}', value = f"{report_data['팔로워 수']}명", delta = f"{report_data['팔로워 증감(수)']:.0f}명({report_data['팔로워 증감(%)']:.2f}%)")
                 # st.markdown(f'''<**{report_data['이름']}**>의 {'팔로워 수'}({report_data['팔로워 수']:.0f}명)는 전주 대비 **{abs(report_data['followers_diff']):.0f}명({abs(report_data['followers_pct_change']):.2f}%)** {inc_dec(report_data['followers_diff'])}''')
             
-            df_to_plot = df_plot_weekly.loc[((df_plot_weekly['날짜'] == date_format(report_date)) | (df_plot_weekly['날짜'] == date_format(report_start))) & (df_plot_weekly["이름"].isin(selected_business))]
+            df_to_plot = pd.concat([weekly.week(report_start), weekly.week(report_date)])
+            df_to_plot = df_to_plot.loc[df_to_plot["이름"].isin(selected_business)]
+            df_to_plot = df_to_plot.assign(**{'날짜': date_format(df_to_plot['날짜'])})
             if selected_business:
                 for feature in ["팔로워 수", "팔로워 증감(수)"]:
                     fig = Bar(df = df_to_plot.sort_values(['날짜', feature]), text = feature, y = feature, x = '이름', group = '이름', colormap = business_colormap , title = feature, range_slider = False, barmode = 'relative', facet_col = '날짜')
@@ -120,14 +127,13 @@ def main():
         with st.container():
             st_header('2. 참여도', num = 4)
         
-            largest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nlargest(1, '참여도 증감(%)')['이름'].values[0]
-            smallest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nsmallest(1, '참여도 증감(%)')['이름'].values[0]
+            largest_inc, smallest_inc = highlights.get('참여도 증감(%)') or best_worst(weekly, report_date, '참여도 증감(%)')
             
             business_to_report = [target_business, largest_inc, smallest_inc]
             cols = st.columns([0.5, 0.25, 0.25])
             for b_idx in range(len(business_to_report)):
                 business = business_to_report[b_idx]
-                report_data = df_weekly_summary.loc[(date_format(df_weekly_summary['날짜']) == date_format(report_date)) & (df_weekly_summary['이름'] == business)].to_dict('records')[0]
+                report_data = weekly.row(report_date, business)
                 with cols[b_idx]:
                     st_header(metric_header[b_idx], num = 5)
                     st.metric(f'{business}', value = f"{report_data['참여도']:.2f}%", delta = f"{report_data['참여도 증감(수)']:.2f}pp({report_data['참여도 증감(%)']:.2f}%)")
@@ -141,15 +147,14 @@ def main():
         with st.container():
             st_header('3. 게시물', num = 4)
         
-            largest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nlargest(1, '게시물 증감(%)')['이름'].values[0]
-            smallest_inc = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date)].nsmallest(1, '게시물 증감(%)')['이름'].values[0]
+            largest_inc, smallest_inc = highlights.get('게시물 증감(%)') or best_worst(weekly, report_date, '게시물 증감(%)')
             
             business_to_report = [target_business, largest_inc, smallest_inc]
             metric_header = ['본 계정', 'Weekly Best', 'Weekly Worst']
             cols = st.columns([0.5, 0.25, 0.25])
             for b_idx in range(len(business_to_report)):
                 business = business_to_report[b_idx]
-                report_data = df_weekly_summary.loc[(date_format(df_weekly_summary['날짜']) == date_format(report_date)) & (df_weekly_summary['이름'] == business)].to_dict('records')[0]
+                report_data = weekly.row(report_date, business)
                 with cols[b_idx]:
                     st_header(metric_header[b_idx], num = 5)
                     st.metric(f'{business}', value = f"{report_data['게시물 수']}개", delta = f"{report_data['게시물 증감(수)']:.0f}개({report_data['게시물 증감(%)']:.2f}%)")
@@ -162,18 +167,18 @@ def main():
             
         with st.container():
             st_header('주간 Top3 게시물(참여도 기준)', num = 6)
-            df_weekly_follower_cnt = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date), ['이름', '팔로워 수']]
+            if artifacts is not None:
+                top_posts = artifacts['top3']
+            else:
+                top_posts = indexed_top_posts(load_top_index(weekly_media, media_source, (report_start, report_end)), weekly.week(report_date), report_end, [target_business])
 
-            df_er = pd.merge(weekly_media, df_weekly_follower_cnt, how = 'inner', left_on = 'name', right_on = '이름')
-            df_er['engagementRate'] = 100 * df_er['engagement'] / df_er['팔로워 수']
-
-            for business in [(all_business, '전체'), ([target_business], target_business)]:
+            for business in [ALL_SCOPE, target_business]:
                 
                 
-                er_top3 = df_er.loc[(df_er['name'].isin(business[0]))].nlargest(3, 'engagementRate')
+                er_top3 = top_posts.loc[top_posts['scope'] == business]
                 
-                if not df_er.empty:
-                    with st.expander(f'{business[1]}'):
+                if not top_posts.empty:
+                    with st.expander(f'{business}'):
 
                         for c in ['timestamp', 'date']:
                             er_top3[c] = pd.to_datetime(er_top3[c])
@@ -215,37 +220,29 @@ def main():
             
     with tab2:
         
-        summary_to_save = df_weekly_summary.loc[date_format(df_weekly_summary['날짜']) == date_format(report_date),
-        ['순위', '이름', '날짜', '팔로우 수', '팔로워 수', '게시물 수', 
-       '좋아요 수', '댓글 수', '참여도', '게시물 당 좋아요', '게시물 당 댓글', '팔로우 증감(수)', '팔로워 증감(수)', '게시물 증감(수)',
-       '좋아요 증감(수)', '댓글 증감(수)', '순위 증감(수)', '참여도 증감(수)', '게시물 당 좋아요 증감(수)',
-       '게시물 당 댓글 증감(수)', '팔로우 증감(%)', '팔로워 증감(%)', '게시물 증감(%)', '좋아요 증감(%)',
-       '댓글 증감(%)', '순위 증감(%)', '참여도 증감(%)', '게시물 당 좋아요 증감(%)',
-       '게시물 당 댓글 증감(%)']].sort_values('순위').reset_index(drop = True)
+        summary_to_save = weekly.week(report_date)[SUMMARY_EXPORT_COLUMNS].sort_values('순위').reset_index(drop = True)
         
-        weekly_media.columns = translate(weekly_media.columns)
-        media_to_save = weekly_media[['이름', '게시물 주소', '게시물 종류', '좋아요 수', '댓글 수', '참여 수', '업로드 시간', '캡션']]
+        # weekly_media keeps its English columns, only the exported copy is translated
+        media_columns = reverse_translation_map(weekly_media.columns)
+        media_to_save = weekly_media[[media_columns[c] for c in MEDIA_EXPORT_COLUMNS]]
+        media_to_save = media_to_save.rename(columns = translation_map(media_to_save.columns))
         
         st_header('주간 데이터', num = 3)
 
+        # Export files are keyed on the table each frame was read from, and rebuilt when the week's artifacts are rewritten or that table changes
+        def export_version(table):
+            return str(os.path.getmtime(report_dir(report_end)) if artifacts is not None else table_version(table))
+
         with st.expander('요약 데이터'):
             st.dataframe(summary_to_save)
-            st.download_button(
-                label="저장",
-                data= convert_df(summary_to_save),
-                file_name=f"IG 요약 데이터 {get_week_num(report_end)}.csv",
-                mime='text/csv',
-                )
+            download_export("저장", 'weekly_summary', report_end, SUMMARY_EXPORT_COLUMNS, lambda: summary_to_save,
+                file_name = f"IG 요약 데이터 {week_label(report_end)}", key = 'export_summary', version = export_version('weekly_summary'))
             
 
         with st.expander('미디어 데이터'):
             st.dataframe(media_to_save)
-            st.download_button(
-                label="저장",
-                data= convert_df(media_to_save),
-                file_name=f"IG 미디어 데이터 {get_week_num(report_end)}.csv",
-                mime='text/csv',
-                )
+            download_export("저장", media_source, report_end, MEDIA_EXPORT_COLUMNS, lambda: media_to_save,
+                file_name = f"IG 미디어 데이터 {week_label(report_end)}", key = 'export_media', version = export_version(media_source))
             
      
     with tab3:
@@ -258,7 +255,9 @@ def main():
 st.set_page_config(layout='wide')
 
 if check_password():
-    main()
+    with profiling.rerun('reports'):
+        main()
+    profiling.profile_panel()
     
 with st.sidebar:
     st.info('''문의 및 요청  